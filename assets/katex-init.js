@@ -0,0 +1,14 @@
+// Math is prerendered at build time; only spans the build could not render
+// (class="math-pending") are left for KaTeX to typeset in the browser.
+document.addEventListener("DOMContentLoaded", function() {
+  if (window.renderMathInElement) {
+    document.querySelectorAll('.math-pending').forEach(function(el) {
+      renderMathInElement(el, {
+        delimiters: [
+          {left: '$$', right: '$$', display: true},
+          {left: '$', right: '$', display: false}
+        ]
+      });
+    });
+  }
+});
@@ -0,0 +1,229 @@
+"""Self-hosted, fingerprinted copies of the scripts and stylesheets pages load.
+
+Third-party files (Prism, KaTeX and the fonts its stylesheet refers to) are
+downloaded from the CDN into assets/vendor/ when missing (or with --fetch).
+Nothing here commits them: the CI workflow adds that directory to its
+commit along with the outputs. Every build copies them, together with our
+own scripts and the weblog stylesheet, to assets/build/<name>.<hash>.<ext>:
+a URL only ever names one version of a file, so browsers can cache it
+indefinitely.
+
+Pages ask for asset groups ('code', 'math', 'copy', ...) and only get the tags of
+the groups their content uses. A vendored file that is missing and cannot
+be fetched falls back to its CDN URL.
+
+Run directly to (re)fetch the vendored files: python scripts/assets.py --fetch
+"""
+import os
+import re
+import argparse
+import posixpath
+import urllib.request
+from urllib.parse import urljoin
+
+from build_manifest import hash_bytes, hash_json
+import profiling
+
+VENDOR_DIR = 'assets/vendor'
+BUILD_DIR = 'assets/build'
+
+PRISM_CDN = 'https://cdn.jsdelivr.net/npm/prismjs@1.29.0/'
+KATEX_CDN = 'https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/'
+
+# Vendored file -> URL it is fetched from
+VENDOR = {
+    'prism.css': PRISM_CDN + 'themes/prism.min.css',
+    'prism.js': PRISM_CDN + 'prism.min.js',
+    'katex.css': KATEX_CDN + 'katex.min.css',
+    'katex.js': KATEX_CDN + 'katex.min.js',
+    'auto-render.js': KATEX_CDN + 'contrib/auto-render.min.js',
+}
+
+# Our own scripts and stylesheets -> source file
+LOCAL = {
+    'copy-code.js': 'assets/copy-code.js',
+    'katex-init.js': 'assets/katex-init.js',
+    'weblog-style.css': 'weblog/weblog-style.css',
+}
+
+# Asset groups a page can ask for; scripts run in the order listed
+GROUPS = {
+    'code': ('prism.css', 'prism.js'),
+    'math': ('katex.css',),
+    'math-runtime': ('katex.css', 'katex.js', 'auto-render.js', 'katex-init.js'),
+    'copy': ('copy-code.js',),
+}
+
+CSS_URL_RE = re.compile(r'url\((["\']?)([^"\')]+)\1\)')
+FETCH_TIMEOUT = 20
+
+
+def page_asset_groups(html_body):
+    """Asset groups needed by a rendered post body."""
+    groups = set()
+    # Fences rendered without Pygments are left for Prism to highlight
+    if '<code class="language-' in html_body:
+        groups.add('code')
+    if 'copyCode(' in html_body:
+        groups.add('copy')
+    # Prerendered math only needs KaTeX's stylesheet; spans the build could
+    # not render (see math_render.py) are typeset in the browser
+    if 'class="math-pending"' in html_body:
+        groups.add('math-runtime')
+    elif 'class="katex' in html_body:
+        groups.add('math')
+    return groups
+
+
+def css_refs(css):
+    """Relative url() references of a stylesheet (fonts, images)."""
+    refs = []
+    for match in CSS_URL_RE.finditer(css):
+        ref = match.group(2).strip()
+        if ref.startswith(('data:', '#', '/')) or '://' in ref:
+            continue
+        refs.append(ref)
+    return refs
+
+
+def _download(url):
+    with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT) as response:
+        return response.read()
+
+
+def _save(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    profiling.record_output(path)
+
+
+def fetch_vendor(names=None, force=False):
+    """Download vendored files (and the files their CSS refers to); return the names that failed."""
+    failed = []
+    for name in names or VENDOR:
+        path = os.path.join(VENDOR_DIR, name)
+        if os.path.exists(path) and not force:
+            continue
+        try:
+            data = _download(VENDOR[name])
+            if name.endswith('.css'):
+                for ref in css_refs(data.decode('utf-8')):
+                    ref_path = os.path.normpath(os.path.join(VENDOR_DIR, ref))
+                    if force or not os.path.exists(ref_path):
+                        _save(ref_path, _download(urljoin(VENDOR[name], ref)))
+            # Saved last: an existing stylesheet implies its fonts are there too
+            _save(path, data)
+            print(f"Fetched {VENDOR[name]}")
+        except OSError as e:
+            print(f"Could not fetch {VENDOR[name]}: {e}")
+            failed.append(name)
+    return failed
+
+
+def fingerprinted_name(rel_path, data):
+    stem, ext = posixpath.splitext(rel_path)
+    return f"{stem}.{hash_bytes(data)[:10]}{ext}"
+
+
+class AssetPipeline:
+    """Publishes every asset under BUILD_DIR and renders the tags pages include.
+
+    `urls` maps an asset name to its path relative to the site root (or to
+    its CDN URL when the vendored copy is unavailable).
+    """
+
+    def __init__(self, fetch=True, out_dir=BUILD_DIR):
+        self.out_dir = out_dir
+        self.urls = {}
+        self.written = 0
+        self._live = set()
+
+        missing = [name for name in VENDOR if not os.path.exists(os.path.join(VENDOR_DIR, name))]
+        if missing and fetch:
+            fetch_vendor(missing)
+        for name, url in VENDOR.items():
+            path = os.path.join(VENDOR_DIR, name)
+            self.urls[name] = self._publish(name, path) if os.path.exists(path) else url
+        for name, path in LOCAL.items():
+            self.urls[name] = self._publish(name, path)
+        self._prune()
+
+    @property
+    def signature(self):
+        """Changes whenever any asset URL does, so pages that link them get rewritten."""
+        return hash_json(self.urls)
+
+    def _publish(self, rel_path, source):
+        with open(source, 'rb') as f:
+            data = f.read()
+        if rel_path.endswith('.css'):
+            data = self._rewrite_css(data.decode('utf-8'), os.path.dirname(source)).encode('utf-8')
+        name = fingerprinted_name(rel_path, data)
+        path = os.path.join(self.out_dir, name)
+        self._live.add(os.path.normpath(path))
+        if not os.path.exists(path):
+            _save(path, data)
+            self.written += 1
+        return posixpath.join(self.out_dir, name)
+
+    def _rewrite_css(self, css, source_dir):
+        """Point url() references at fingerprinted copies of the files they name."""
+        def replace(match):
+            ref = match.group(2).strip()
+            if ref not in refs:
+                return match.group(0)
+            rel = posixpath.normpath(ref)
+            source = os.path.join(source_dir, rel)
+            if rel.startswith('..') or not os.path.exists(source):
+                return match.group(0)
+            published = self._publish(rel, source)
+            return f"url({posixpath.relpath(published, self.out_dir)})"
+
+        refs = set(css_refs(css))
+        return CSS_URL_RE.sub(replace, css)
+
+    def _prune(self):
+        """Remove fingerprinted files no current asset refers to."""
+        for dirpath, _, filenames in os.walk(self.out_dir):
+            for filename in filenames:
+                path = os.path.normpath(os.path.join(dirpath, filename))
+                # Precompressed siblings (see compress.py) live as long as their source
+                source = os.path.splitext(path)[0] if path.endswith(('.gz', '.br')) else path
+                if source not in self._live:
+                    os.remove(path)
+
+    def tags(self, groups, site_root):
+        """<link>/<script> tags for `groups`, stylesheets first; `site_root` is the relative path to the site root."""
+        styles = []
+        scripts = []
+        for group, names in GROUPS.items():
+            if group not in groups:
+                continue
+            for name in names:
+                url = self.urls[name]
+                if '://' not in url:
+                    url = site_root + url
+                if name.endswith('.css'):
+                    styles.append(f'<link rel="stylesheet" href="{url}">')
+                else:
+                    scripts.append(f'<script defer src="{url}"></script>')
+        return styles + scripts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch vendored assets and publish fingerprinted copies")
+    parser.add_argument('--fetch', action='store_true',
+                        help=f"re-download every vendored file into {VENDOR_DIR}")
+    args = parser.parse_args(argv)
+    if args.fetch and fetch_vendor(force=True):
+        raise SystemExit(1)
+    pipeline = AssetPipeline(fetch=not args.fetch)
+    for name, url in pipeline.urls.items():
+        print(f"{name}: {url}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""End-to-end build benchmark on synthetic corpora of increasing size.
+
+For each corpus size two fresh sites are generated (see corpus.py): one
+is built by generate_til.py and generate_rss.py as separate processes,
+the other by build.py, as CI runs it (link check and compression
+included). Each goes through three scenarios:
+
+  cold  no outputs, manifest or render cache
+  warm  the same tree again with --incremental, nothing changed
+  edit  one post modified, --incremental
+
+Wall time, peak RSS (largest process in the run, render workers included
+once they exit), total output size and the number of files the run
+created or replaced (a warm run should write none) are written as JSON,
+so runs can be compared across commits.
+
+    python scripts/bench/bench_build.py [--sizes 100 1000 10000] [--output .build/bench/results.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+import corpus
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_OUTPUT = '.build/bench/results.json'
+
+# Paths (relative to the site root) the generators write
+OUTPUT_PATHS = ['weblog/posts', 'weblog/tags', 'weblog/page', 'weblog/series', 'weblog/search', 'weblog/index.html',
+                'assets/build', 'assets/img', 'rss.xml', 'feed.json', 'atom.xml', 'sitemap.xml', 'feeds']
+
+
+def run(site, script, args):
+    """Run one generator in `site`; return (seconds, peak RSS in KiB)."""
+    cmd = [sys.executable, os.path.join(SCRIPTS_DIR, script)] + args
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=site, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(proc.pid, 0)
+    seconds = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        raise SystemExit(f"{script} {' '.join(args)} failed with exit code {proc.returncode} in {site}")
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    return seconds, peak
+
+
+def file_mtimes(site):
+    """{path: mtime_ns} of every file of the site outside .build/."""
+    mtimes = {}
+    for dirpath, dirnames, filenames in os.walk(site):
+        dirnames[:] = [d for d in dirnames if d != '.build']
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            mtimes[path] = os.stat(path).st_mtime_ns
+    return mtimes
+
+
+def output_bytes(site):
+    total = 0
+    for rel in OUTPUT_PATHS:
+        path = os.path.join(site, rel)
+        if os.path.isfile(path):
+            total += os.path.getsize(path)
+            continue
+        for dirpath, _, filenames in os.walk(path):
+            total += sum(os.path.getsize(os.path.join(dirpath, f))
+                         for f in filenames if not f.endswith('.md'))
+    return total
+
+
+def edit_one_post(site):
+    posts_dir = os.path.join(site, 'weblog', 'posts')
+    name = sorted(f for f in os.listdir(posts_dir) if f.endswith('.md'))[-1]
+    with open(os.path.join(posts_dir, name), 'a', encoding='utf-8') as f:
+        f.write("\nOne more paragraph added by the edit scenario.\n")
+
+
+def bench_size(posts, args):
+    jobs = ['-j', str(args.jobs)]
+    # Each pipeline gets its own site, so its cold run starts from nothing
+    pipelines = {
+        'separate': [('generate_til.py', jobs), ('generate_rss.py', [])],
+        'build': [('build.py', jobs)],
+    }
+    results = []
+    for pipeline, scripts in pipelines.items():
+        site = os.path.join(args.workdir, f"site-{posts}-{pipeline}")
+        corpus.generate(site, posts, args.blog_pages, args.code_blocks, args.tags,
+                        args.paragraphs, args.math_ratio, seed=args.seed)
+        for scenario in ('cold', 'warm', 'edit'):
+            if scenario == 'edit':
+                edit_one_post(site)
+            extra = [] if scenario == 'cold' else ['--incremental']
+            for script, script_args in scripts:
+                # generate_rss.py has no manifest: every run reads all sources
+                if script != 'generate_rss.py':
+                    script_args = script_args + extra
+                before = file_mtimes(site)
+                seconds, peak = run(site, script, script_args)
+                after = file_mtimes(site)
+                written = sum(1 for path, mtime in after.items() if before.get(path) != mtime)
+                results.append({'posts': posts, 'scenario': scenario, 'script': script,
+                                'seconds': round(seconds, 4), 'peak_rss_kib': peak,
+                                'output_bytes': output_bytes(site), 'files_written': written})
+                print(f"{posts:>6} posts  {scenario:<4}  {script:<16} {seconds:8.2f}s  "
+                      f"{peak / 1024:7.1f} MiB  {results[-1]['output_bytes'] / 1024:9.0f} KiB  "
+                      f"{written:>6} files written")
+        if not args.keep:
+            shutil.rmtree(site)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=SCRIPTS_DIR, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="render workers passed to generate_til.py")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help=f"results file (default: {DEFAULT_OUTPUT})")
+    parser.add_argument('--workdir', help="where to create the synthetic sites (default: a temp dir)")
+    parser.add_argument('--keep', action='store_true', help="keep the synthetic sites after the run")
+    corpus.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='weblog-bench-')
+    args.workdir = workdir
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    try:
+        for posts in args.sizes:
+            results.extend(bench_size(posts, args))
+    finally:
+        if not args.keep and not os.listdir(workdir):
+            os.rmdir(workdir)
+
+    report = {
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'params': {k: v for k, v in vars(args).items() if k not in ('output', 'workdir', 'keep')},
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
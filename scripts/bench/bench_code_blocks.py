@@ -0,0 +1,115 @@
+"""Micro-benchmark for add_code_block_features on a post with many code blocks.
+
+Compares the current single-pass rewriter with the previous implementation
+(string concatenation plus re-slicing every block) on synthetic codehilite
+output, and checks both produce the same markup apart from block IDs.
+
+    python scripts/bench/bench_code_blocks.py [--blocks 1000] [--repeat 5]
+"""
+import os
+import re
+import sys
+import time
+import uuid
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_til import add_code_block_features  # noqa: E402
+
+
+def legacy_add_code_block_features(html_content):
+    """The pre-rewrite implementation, kept here as the baseline.
+
+    It used to append the copyCode script too; that now ships as a shared
+    asset, so both sides leave it out.
+    """
+    processed_html = ""
+    last_end = 0
+    pattern = re.compile(r'<div class="codehilite[^"]*">')
+
+    for match in pattern.finditer(html_content):
+        start = match.start()
+        processed_html += html_content[last_end:start]
+
+        end_div_pos = html_content.find('</div>', start)
+        if end_div_pos == -1:
+            processed_html += html_content[start:]
+            last_end = len(html_content)
+            break
+
+        end = end_div_pos + len('</div>')
+        code_block_html = html_content[start:end]
+
+        lang_match = re.search(r'language-([^\s"]+)', code_block_html)
+        lang = lang_match.group(1) if lang_match else ''
+
+        block_id = f"code-block-{uuid.uuid4().hex[:6]}"
+
+        clipboard_svg = '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M16 4h2a2 2 0 0 1 2 2v14a2 2 0 0 1-2 2H6a2 2 0 0 1-2-2V6a2 2 0 0 1 2-2h2"></path><rect x="8" y="2" width="8" height="4" rx="1" ry="1"></rect></svg>'
+
+        toolbar_html = f'''<div class="code-toolbar">
+    <span class="language-name">{lang}</span>
+    <button class="copy-btn" onclick="copyCode(this, \'{block_id}\')" aria-label="Copy code to clipboard">
+        {clipboard_svg}
+    </button>
+    <a class="anchor-link" href="#{block_id}" aria-label="Link to this code block">🔗</a>
+</div>'''
+
+        modified_block = code_block_html.replace('class="codehilite', 'class="codehilite-container codehilite', 1)
+
+        pre_pos = modified_block.find('<pre')
+        if pre_pos != -1:
+            modified_block = modified_block[:pre_pos] + toolbar_html + modified_block[pre_pos:]
+            new_pre_pos = modified_block.find('<pre', pre_pos + len(toolbar_html))
+            modified_block = modified_block[:new_pre_pos+4] + f' id="{block_id}"' + modified_block[new_pre_pos+4:]
+
+        processed_html += modified_block
+        last_end = end
+
+    processed_html += html_content[last_end:]
+    return processed_html
+
+
+def synthetic_post(blocks, lines_per_block=12):
+    parts = []
+    for i in range(blocks):
+        parts.append(f'<p>Paragraph {i} explaining the snippet below in a sentence or two.</p>\n')
+        code = ''.join(f'<span class="n">value_{i}_{j}</span><span class="w"> </span>'
+                       f'<span class="o">=</span><span class="w"> </span><span class="mi">{j}</span>\n'
+                       for j in range(lines_per_block))
+        parts.append(f'<div class="codehilite"><pre><span></span><code class="language-python">{code}</code></pre></div>\n')
+    return ''.join(parts)
+
+
+def best_of(fn, html, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(html)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--blocks', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    html = synthetic_post(args.blocks)
+    normalize = re.compile(r'code-block-[0-9a-f]{6}(-\d+)?')
+    if normalize.sub('ID', legacy_add_code_block_features(html)) != normalize.sub('ID', add_code_block_features(html)):
+        sys.exit("output mismatch between legacy and single-pass implementations")
+    if add_code_block_features(html) != add_code_block_features(html):
+        sys.exit("single-pass output is not deterministic")
+
+    legacy = best_of(legacy_add_code_block_features, html, args.repeat)
+    current = best_of(add_code_block_features, html, args.repeat)
+    print(f"{args.blocks} code blocks, {len(html) / 1024:.0f} KiB of HTML (best of {args.repeat})")
+    print(f"  legacy concat : {legacy * 1000:8.2f} ms")
+    print(f"  single pass   : {current * 1000:8.2f} ms  ({legacy / current:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
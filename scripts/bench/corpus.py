@@ -0,0 +1,148 @@
+"""Synthetic site trees for benchmarking the generators.
+
+Writes weblog/posts/*.md, blog/*.html and code/index.html into a fresh
+directory, together with the hand-maintained files the generators splice
+into or copy from (weblog/index.html, the asset sources and any vendored
+assets). Content is deterministic for a given seed.
+
+    python scripts/bench/corpus.py OUT_DIR [--posts 1000] [--code-blocks 2] [--tags 50]
+"""
+import os
+import random
+import shutil
+import argparse
+from datetime import date, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Files copied from the real tree: templates the generators update in place,
+# and the pages the feeds and weblog index link to (checked by build.py)
+TEMPLATE_FILES = ['weblog/index.html', 'weblog/weblog-style.css', 'assets/copy-code.js', 'assets/katex-init.js',
+                  'index.html', 'blog/index.html']
+TEMPLATE_DIRS = ['assets/vendor']
+
+WORDS = ('packet socket kernel buffer cache latency throughput allocator heap page tree hash '
+         'noise gradient vector matrix thread queue lock syscall protocol header frame stream '
+         'checksum parser render index shard merge feed token compile linker loader signal').split()
+
+CODE_SAMPLES = {
+    'python': ['def step(state, dt):', '    for body in state.bodies:',
+               '        body.velocity += body.force * dt', '    return state'],
+    'c': ['static size_t align_up(size_t n, size_t a) {', '    return (n + a - 1) & ~(a - 1);', '}'],
+    'bash': ['for f in *.log; do', '  gzip -9 "$f"', 'done'],
+}
+
+MATH_SAMPLES = ['$x^2 + y^2 = r^2$', '$O(n \\log n)$', '$\\sum_{i=1}^{n} i = \\frac{n(n+1)}{2}$']
+
+
+def sentence(rng, words=12):
+    text = ' '.join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def paragraph(rng, sentences=4):
+    return ' '.join(sentence(rng) for _ in range(sentences))
+
+
+def code_block(rng):
+    lang = rng.choice(sorted(CODE_SAMPLES))
+    lines = CODE_SAMPLES[lang] * rng.randint(1, 4)
+    return f"```{lang}\n" + '\n'.join(lines) + "\n```"
+
+
+def post_markdown(rng, index, paragraphs, code_blocks, tags, math_ratio):
+    title = ' '.join(rng.choice(WORDS) for _ in range(4)).title()
+    post_tags = sorted({f"tag{rng.randrange(tags)}" for _ in range(rng.randint(1, 3))})
+    parts = [f"---\ntitle: {title} {index}\ntags: [{', '.join(post_tags)}]\n---\n"]
+    blocks = [paragraph(rng) for _ in range(paragraphs)]
+    for _ in range(code_blocks):
+        blocks.insert(rng.randrange(len(blocks) + 1), code_block(rng))
+    if rng.random() < math_ratio:
+        blocks.append(f"The bound is {rng.choice(MATH_SAMPLES)} in the worst case.")
+    parts.append('\n\n'.join(blocks))
+    return '\n'.join(parts) + '\n'
+
+
+def blog_page(rng, index):
+    title = ' '.join(rng.choice(WORDS) for _ in range(3)).title()
+    body = '\n'.join(f"        <p>{paragraph(rng)}</p>" for _ in range(5))
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8" />
+    <meta name="description" content="{sentence(rng)}" />
+    <title>{title} {index}</title>
+</head>
+<body>
+    <main>
+        <h1>{title}</h1>
+{body}
+    </main>
+</body>
+</html>
+"""
+
+
+def code_index(rng, projects):
+    cards = '\n'.join(f"""        <div class="project">
+            <a href="https://example.com/project-{i}/" target="_blank">project-{i}</a>
+            <div class="subheading">{sentence(rng, 8)}</div>
+        </div>""" for i in range(projects))
+    return f"<!DOCTYPE html>\n<html>\n<body>\n{cards}\n</body>\n</html>\n"
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def generate(out_dir, posts=1000, blog_pages=None, code_blocks=2, tags=50, paragraphs=6,
+             math_ratio=0.1, projects=20, seed=0):
+    """Create a synthetic site under `out_dir` (which must not exist yet)."""
+    rng = random.Random(seed)
+    os.makedirs(out_dir)
+    for rel in TEMPLATE_FILES:
+        src = os.path.join(REPO_ROOT, rel)
+        if os.path.exists(src):
+            os.makedirs(os.path.dirname(os.path.join(out_dir, rel)), exist_ok=True)
+            shutil.copy(src, os.path.join(out_dir, rel))
+    for rel in TEMPLATE_DIRS:
+        src = os.path.join(REPO_ROOT, rel)
+        if os.path.isdir(src):
+            shutil.copytree(src, os.path.join(out_dir, rel))
+
+    first_day = date(2025, 1, 1)
+    for i in range(posts):
+        day = first_day - timedelta(days=i // 3)
+        name = f"{day.isoformat()}-post-{i}.md"
+        write(os.path.join(out_dir, 'weblog', 'posts', name),
+              post_markdown(rng, i, paragraphs, code_blocks, tags, math_ratio))
+    for i in range(posts if blog_pages is None else blog_pages):
+        write(os.path.join(out_dir, 'blog', f"page-{i}.html"), blog_page(rng, i))
+    write(os.path.join(out_dir, 'code', 'index.html'), code_index(rng, projects))
+    return out_dir
+
+
+def add_arguments(parser):
+    parser.add_argument('--code-blocks', type=int, default=2, help="fenced code blocks per post")
+    parser.add_argument('--tags', type=int, default=50, help="number of distinct tags")
+    parser.add_argument('--paragraphs', type=int, default=6, help="prose paragraphs per post")
+    parser.add_argument('--math-ratio', type=float, default=0.1, help="fraction of posts with inline math")
+    parser.add_argument('--blog-pages', type=int, help="blog/*.html pages (default: same as posts)")
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('out_dir')
+    parser.add_argument('--posts', type=int, default=1000)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    generate(args.out_dir, args.posts, args.blog_pages, args.code_blocks, args.tags,
+             args.paragraphs, args.math_ratio, seed=args.seed)
+    print(f"Wrote {args.posts} posts to {args.out_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Build the weblog pages, the feeds and the sitemap from a single parse of weblog/posts.
+
+Runs generate_til and generate_rss against one shared list of Post records,
+so every source file is read, hashed and YAML-parsed once per build.
+Accepts the same options as generate_til.py. Afterwards the internal links
+and anchors of the outputs are checked (see linkcheck.py; a broken one fails
+the build) unless --no-linkcheck, and every text output gets precompressed
+.gz/.br siblings (see compress.py) unless --no-compress.
+"""
+import argparse
+
+import compress
+import generate_rss
+import generate_til
+import linkcheck
+import profiling
+from content import load_posts
+from output import stats as output_stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build weblog pages and the RSS feed in one pass")
+    generate_til.add_arguments(parser)
+    linkcheck.add_arguments(parser)
+    compress.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with profiling.session(args):
+        manifest = generate_til.open_manifest(args.manifest)
+        with profiling.stage('load'):
+            posts = load_posts(manifest, args.incremental)
+        generate_til.build_from_args(posts, manifest, args)
+        with profiling.stage('rss'):
+            generate_rss.build(posts, max(1, args.page_size), use_cache=not args.no_cache, cache_path=args.cache)
+        manifest.save()
+        if not args.no_linkcheck:
+            with profiling.stage('links'):
+                broken = linkcheck.check_links(max(1, args.jobs))
+            if broken:
+                raise SystemExit(f"{len(broken)} broken links")
+        if not args.no_compress:
+            with profiling.stage('compress'):
+                compress.compress_outputs(max(1, args.jobs))
+    print(output_stats.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import os
+import glob
+import json
+import hashlib
+
+MANIFEST_FILE = '.build/manifest.json'
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_text(text):
+    return hash_bytes(text.encode('utf-8'))
+
+
+def hash_json(obj):
+    """Stable hash of a JSON-serialisable value (used as a page signature)."""
+    return hash_text(json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str))
+
+
+def generator_fingerprint(*extra):
+    """Hash of the generator sources, so a change to any script or template forces a full rebuild."""
+    h = hashlib.sha256()
+    sources = glob.glob(os.path.join(SCRIPTS_DIR, '*.py')) + glob.glob(os.path.join(SCRIPTS_DIR, 'templates', '*'))
+    for path in sorted(sources):
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    for item in extra:
+        h.update(str(item).encode('utf-8'))
+    return h.hexdigest()
+
+
+class Manifest:
+    """Persisted record of source hashes, post metadata and output signatures.
+
+    `posts` maps a source file to its content hash and parsed frontmatter;
+    `pages` maps an output path (or index section) to the signature of the
+    inputs it was last built from; `images` maps a post page to the image
+    originals and derivatives it was last built with (see images.py).
+    """
+
+    def __init__(self, path=MANIFEST_FILE, fingerprint=''):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.posts = {}
+        self.pages = {}
+        self.images = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            # A manifest written by different generator code describes
+            # different outputs; start from scratch rather than trust it.
+            if data.get('fingerprint') == fingerprint:
+                self.posts = data.get('posts', {})
+                self.pages = data.get('pages', {})
+                self.images = data.get('images', {})
+
+    def post_entry(self, source, source_hash):
+        """Return the stored entry for `source` if its hash is unchanged."""
+        entry = self.posts.get(source)
+        if entry and entry.get('hash') == source_hash:
+            return entry
+        return None
+
+    def record_post(self, source, source_hash, meta, output):
+        self.posts[source] = {'hash': source_hash, 'meta': meta, 'output': output}
+
+    def forget_missing(self, sources):
+        """Drop entries for sources that no longer exist; return their slugs."""
+        removed = [s for s in self.posts if s not in sources]
+        return [self.posts.pop(s)['meta'].get('slug') for s in removed]
+
+    def is_fresh(self, key, signature, output=None):
+        """True if `key` was last built from `signature` and its output still exists."""
+        if self.pages.get(key) != signature:
+            return False
+        return output is None or os.path.exists(output)
+
+    def record_page(self, key, signature):
+        self.pages[key] = signature
+
+    def record_images(self, output, record):
+        self.images[output] = record
+
+    def forget_images(self, outputs):
+        """Drop the image records of pages not in `outputs`; return the rest."""
+        for output in set(self.images) - set(outputs):
+            del self.images[output]
+        return list(self.images.values())
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': self.fingerprint, 'posts': self.posts, 'pages': self.pages,
+                       'images': self.images}, f, sort_keys=True, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
@@ -0,0 +1,163 @@
+"""Precompressed .gz and .br siblings of the generated text files.
+
+Static hosts and CDNs that serve precompressed variants pick up
+<file>.gz / <file>.br next to each page, feed, stylesheet and script, so
+nothing is compressed per request. Both are written at maximum level;
+brotli is optional (pip install brotli), without it only .gz is made
+(and existing .br files, which would go stale, are removed).
+gzip output carries no timestamp or name, so unchanged input gives
+byte-identical output.
+
+.build/compressed.json remembers the content hash each file was last
+compressed from. A file whose size and mtime are unchanged is skipped
+without reading it; otherwise it is hashed and only recompressed if the
+hash differs (a fresh checkout changes mtimes, not content). The work is
+spread over a process pool. Siblings whose source is gone are removed.
+
+    python scripts/compress.py [-j N]
+"""
+import os
+import glob
+import gzip
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from build_manifest import hash_bytes
+from output import atomic_open
+import profiling
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATE_FILE = '.build/compressed.json'
+
+# Generated text outputs (and the stylesheets pages load)
+PATTERNS = [
+    'weblog/**/*.html', 'weblog/**/*.json', 'weblog/*.css', 'blog/*.css', 'style.css',
+    'rss.xml', 'atom.xml', 'feed.json', 'sitemap.xml', 'feeds/**/*.xml',
+    'assets/build/**/*.css', 'assets/build/**/*.js',
+]
+
+
+def suffixes():
+    return ('.gz', '.br') if brotli else ('.gz',)
+
+
+def text_outputs():
+    paths = set()
+    for pattern in PATTERNS:
+        paths.update(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+    return sorted(paths)
+
+
+def compress_file(path):
+    """Write the siblings of one file; runs in worker processes. Returns (path, content hash)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    with atomic_open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli:
+        with atomic_open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+    return path, hash_bytes(data)
+
+
+def load_state(path=STATE_FILE):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, sort_keys=True, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def stale_files(paths, state):
+    """Files whose siblings are missing or were made from other content."""
+    stale = []
+    for path in paths:
+        st = os.stat(path)
+        entry = state.get(path)
+        if not all(os.path.exists(path + s) for s in suffixes()):
+            stale.append(path)
+        elif entry and entry[1:] == [st.st_mtime_ns, st.st_size]:
+            continue
+        else:
+            with open(path, 'rb') as f:
+                digest = hash_bytes(f.read())
+            if entry and entry[0] == digest:
+                entry[1:] = [st.st_mtime_ns, st.st_size]
+            else:
+                stale.append(path)
+    return stale
+
+
+def remove_orphans(paths):
+    """Delete .gz/.br files whose source no longer exists (or is no longer an output).
+
+    Without brotli every .br goes: it can't be kept in step with its source.
+    """
+    live = set(paths)
+    made = suffixes()
+    removed = 0
+    for pattern in PATTERNS:
+        for suffix in ('.gz', '.br'):
+            for sibling in glob.glob(pattern + suffix, recursive=True):
+                if suffix not in made or sibling[:-len(suffix)] not in live:
+                    os.remove(sibling)
+                    removed += 1
+    return removed
+
+
+def compress_outputs(jobs=1, state_path=STATE_FILE):
+    """Bring every output's siblings up to date; return the number of files recompressed."""
+    paths = text_outputs()
+    state = {path: entry for path, entry in load_state(state_path).items() if path in paths}
+    with profiling.stage('scan'):
+        stale = stale_files(paths, state)
+    with profiling.stage('compress'):
+        if jobs > 1 and len(stale) > 1:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(stale))) as pool:
+                results = list(pool.map(compress_file, stale, chunksize=8))
+        else:
+            results = [compress_file(path) for path in stale]
+        # Workers can't report to the profile: their siblings are counted here
+        for path, _ in results:
+            for suffix in suffixes():
+                profiling.record_output(path + suffix)
+    for path, digest in results:
+        st = os.stat(path)
+        state[path] = [digest, st.st_mtime_ns, st.st_size]
+    removed = remove_orphans(paths)
+    save_state(state, state_path)
+    print(f"Compressed: {len(stale)}/{len(paths)} files ({', '.join(suffixes())}), "
+          f"{removed} stale variants removed" + ("" if brotli else "; install brotli for .br"))
+    return len(stale)
+
+
+def add_arguments(parser):
+    parser.add_argument('--no-compress', action='store_true',
+                        help="don't write precompressed .gz/.br copies of the outputs")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write .gz/.br siblings of the generated text files")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: number of CPUs, 1 = serial)")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    with profiling.session(args):
+        compress_outputs(max(1, args.jobs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import os
+import glob
+import time
+import shutil
+from datetime import datetime, timedelta, timezone
+
+import yaml
+
+import git_dates
+import profiling
+from build_manifest import hash_bytes
+
+POSTS_DIR = 'weblog/posts'
+SITE_URL = "https://gaurv.me"
+
+# Helper for IST
+IST = timezone(timedelta(hours=5, minutes=30))
+
+def parse_slug_from_filename(filename):
+    # expects yyyy-mm-dd-slug.md or slug.md
+    base = os.path.basename(filename)
+    if base.count('-') >= 3 and base[:4].isdigit():
+        parts = base.split('-')
+        slug = '-'.join(parts[3:]).replace('.md', '')
+    else:
+        slug = base.replace('.md', '')
+    return slug
+
+def parse_date_from_filename(filename):
+    # expects yyyy-mm-dd-slug.md
+    base = os.path.basename(filename)
+    parts = base.split('-')
+    if len(parts) >= 3 and parts[0].isdigit() and parts[1].isdigit() and parts[2].isdigit():
+        year, month, day = parts[0], parts[1], parts[2]
+        return datetime(int(year), int(month), int(day), tzinfo=IST)
+    return None
+
+def file_dates(path):
+    """(published, updated) of a file in IST: its first and last commit, else its mtime.
+
+    Only files that were never committed fall back to the mtime, which a
+    checkout resets; committed files get the same dates on every machine.
+    """
+    dates = git_dates.dates()
+    first, last = dates.first(path), dates.last(path)
+    if first is None:
+        # Whole seconds, as the feeds store them: a fresher fraction would
+        # sort a re-read item ahead of its published copy
+        first = last = datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc).replace(microsecond=0)
+    return first.astimezone(IST), last.astimezone(IST)
+
+def split_frontmatter(content):
+    """Return (meta, body) for a post, or (None, None) if the frontmatter is invalid."""
+    try:
+        _, fm, body = content.split('---', 2)
+        meta = yaml.safe_load(fm)
+    except (ValueError, yaml.YAMLError):
+        return None, None
+    if not isinstance(meta, dict):
+        return None, None
+    return meta, body
+
+
+class Post:
+    """One weblog post, shared by the page and feed generators.
+
+    `markdown` holds the raw body when the source was parsed in this run and
+    `body` the rendered HTML once a generator has rendered it; both stay None
+    for posts whose metadata came from the build manifest.
+    """
+
+    __slots__ = ('source', 'filename', 'hash', 'slug', 'title', 'weblog_title', 'date', 'date_str',
+                 'updated', 'tags', 'collection', 'excerpt', 'markdown', 'body')
+
+    # Frontmatter-derived fields persisted in the build manifest
+    STORED_FIELDS = ('slug', 'title', 'weblog_title', 'tags', 'collection', 'excerpt')
+
+    def __init__(self, source, source_hash, meta):
+        self.source = source
+        self.filename = os.path.basename(source)
+        self.hash = source_hash
+        # Get slug from frontmatter or generate from filename
+        self.slug = meta.get('slug', parse_slug_from_filename(source))
+        self.title = meta.get('title', self.slug.replace('-', ' ').title())
+        self.weblog_title = meta.get('weblog_title', self.title)
+        # Get date from filename if present, else from when the post was committed
+        published, updated = file_dates(source)
+        self.date = parse_date_from_filename(source) or published
+        self.updated = max(self.date, updated)
+        self.date_str = self.date.strftime('%Y-%m-%d')
+        self.tags = meta.get('tags', [])
+        self.collection = meta.get('collection', None)
+        self.excerpt = meta.get('excerpt', '')
+        self.markdown = None
+        self.body = None
+
+    def stored_meta(self):
+        return {field: getattr(self, field) for field in self.STORED_FIELDS}
+
+    def load_markdown(self):
+        """Return the Markdown body, re-reading the source if only cached metadata was loaded."""
+        if self.markdown is None:
+            with open(self.source, encoding="utf-8") as f:
+                _, self.markdown = split_frontmatter(f.read())
+        return self.markdown
+
+    @property
+    def output_path(self):
+        return os.path.join('weblog', 'posts', self.slug, 'index.html')
+
+
+def prune_post_pages(slugs, posts, posts_dir=POSTS_DIR):
+    """Remove the page directories of `slugs` that no current post uses."""
+    live = {p.slug for p in posts}
+    for slug in set(slugs) - live:
+        if slug and os.path.isdir(os.path.join(posts_dir, slug)):
+            shutil.rmtree(os.path.join(posts_dir, slug))
+
+def load_posts(manifest=None, incremental=False, posts_dir=POSTS_DIR):
+    """Read and parse every post once, oldest file name first.
+
+    With a manifest, each source is hashed and, in incremental mode,
+    unchanged posts are rebuilt from their stored frontmatter without
+    running YAML again. Pages of posts that were deleted, or whose slug
+    changed, are removed.
+    """
+    posts = []
+    old_slugs = []
+    for md_file in sorted(glob.glob(f"{posts_dir}/*.md")):
+        with open(md_file, 'rb') as f:
+            raw = f.read()
+        source_hash = hash_bytes(raw)
+        entry = manifest.post_entry(md_file, source_hash) if manifest and incremental else None
+        if entry:
+            posts.append(Post(md_file, source_hash, entry['meta']))
+            continue
+        start = time.perf_counter()
+        meta, body = split_frontmatter(raw.decode('utf-8'))
+        if meta is None:
+            print(f"Skipping {md_file}: invalid frontmatter")
+            continue
+        post = Post(md_file, source_hash, dict(meta, excerpt=body[:180]))
+        post.markdown = body
+        profiling.record_post(post.slug, {'frontmatter': time.perf_counter() - start})
+        if manifest:
+            previous = manifest.posts.get(md_file)
+            if previous:
+                old_slugs.append(previous['meta'].get('slug'))
+            manifest.record_post(md_file, source_hash, post.stored_meta(), post.output_path)
+        posts.append(post)
+    if manifest:
+        old_slugs += manifest.forget_missing({p.source for p in posts})
+        prune_post_pages(old_slugs, posts, posts_dir)
+    return posts
@@ -0,0 +1,311 @@
+"""Feeds and the sitemap, accumulated from one pass over the items.
+
+generate_rss.py streams the items (blog pages, weblog posts, code
+projects) into a FeedSet once; everything here is derived from it:
+
+  rss.xml, feed.json, atom.xml   the MAX_ITEMS newest items as RSS 2.0,
+                                 JSON Feed 1.1 and Atom
+  feeds/<category>.xml           RSS per category (blog, weblog, code)
+  feeds/tags/<tag slug>.xml      RSS per weblog tag
+  sitemap.xml                    every page with its lastmod, including
+                                 the archive pages and code/
+
+An item is a dict with 'title', 'link', 'description', 'pubDate',
+'pubDate_obj' and 'category', plus optionally 'updated' (datetime),
+'tags', 'collection' and 'page' (the site URL listed in the sitemap).
+A None description is filled by calling item['summary'] the first time
+the item is written, so only items that end up in some feed are
+summarized. A FeedSet keeps the MAX_ITEMS newest items of each feed in
+a heap and one lastmod per sitemap URL, so memory grows with the number
+of feeds and pages, never with a list of every item. Files are only
+replaced when their content changed, and lastBuildDate/<updated> only
+move with the items.
+"""
+import io
+import os
+import json
+import heapq
+from datetime import datetime
+from xml.sax.saxutils import XMLGenerator
+
+from content import IST, SITE_URL
+from navigation import series_slug, tag_slug
+from output import unchanged, write_if_changed
+from page_meta import read_last_build_date
+
+RSS_FILE = "rss.xml"
+JSON_FEED_FILE = "feed.json"
+ATOM_FILE = "atom.xml"
+SITEMAP_FILE = "sitemap.xml"
+FEEDS_DIR = "feeds"
+RSS_DATE_FORMAT = '%a, %d %b %Y %H:%M:%S %z'
+MAX_ITEMS = 30  # most recent items kept in each feed
+SUMMARY_CHARS = 280
+
+FEED_TITLE = 'Gaurav - updates'
+FEED_DESCRIPTION = 'RSS feed for blog, weblogs, and code updates.'
+AUTHOR = 'Gaurav'
+CATEGORIES = ('blog', 'weblog', 'code')
+
+
+def item_date(item):
+    return item['pubDate_obj']
+
+
+def item_updated(item):
+    return item.get('updated') or item['pubDate_obj']
+
+
+def describe(item):
+    """The item's plain-text description, summarizing its page on first use."""
+    if item.get('description') is None:
+        summary = item.pop('summary', None)
+        item['description'] = summary() if summary else ''
+    return item['description']
+
+
+# --- RSS 2.0 ---
+
+def _text_element(xml, name, text):
+    xml.startElement(name, {})
+    xml.characters(text)
+    xml.endElement(name)
+    xml.ignorableWhitespace('\n')
+
+
+def render_rss(items, build_date, title=FEED_TITLE, description=FEED_DESCRIPTION, link=f'{SITE_URL}/'):
+    """Serialize the channel and its items to bytes."""
+    f = io.BytesIO()
+    xml = XMLGenerator(f, encoding='UTF-8', short_empty_elements=False)
+    xml.startDocument()
+    xml.startElement('rss', {'version': '2.0'})
+    xml.ignorableWhitespace('\n')
+    xml.startElement('channel', {})
+    xml.ignorableWhitespace('\n')
+    _text_element(xml, 'title', title)
+    _text_element(xml, 'link', link)
+    _text_element(xml, 'description', description)
+    _text_element(xml, 'lastBuildDate', build_date)
+
+    for item in items:
+        xml.startElement('item', {})
+        xml.ignorableWhitespace('\n')
+        _text_element(xml, 'title', item['title'])
+        _text_element(xml, 'link', item['link'])
+        _text_element(xml, 'description', describe(item))
+        _text_element(xml, 'pubDate', item['pubDate'])
+        _text_element(xml, 'category', item['category'])
+        xml.endElement('item')
+        xml.ignorableWhitespace('\n')
+
+    xml.endElement('channel')
+    xml.ignorableWhitespace('\n')
+    xml.endElement('rss')
+    xml.ignorableWhitespace('\n')
+    xml.endDocument()
+    return f.getvalue()
+
+
+def write_rss(items, path=RSS_FILE, **channel):
+    """Replace `path` atomically if the items changed; return True if it was written.
+
+    lastBuildDate only moves when the feed's content does, so a build
+    with nothing new leaves the file untouched.
+    """
+    previous = read_last_build_date(path) if os.path.exists(path) else None
+    if previous and unchanged(path, render_rss(items, previous, **channel)):
+        return False
+    return write_if_changed(path, render_rss(items, datetime.now(IST).strftime(RSS_DATE_FORMAT), **channel))
+
+
+# --- JSON Feed and Atom ---
+
+def render_json_feed(items):
+    feed = {
+        'version': 'https://jsonfeed.org/version/1.1',
+        'title': FEED_TITLE,
+        'home_page_url': f'{SITE_URL}/',
+        'feed_url': f'{SITE_URL}/{JSON_FEED_FILE}',
+        'description': FEED_DESCRIPTION,
+        'authors': [{'name': AUTHOR}],
+        'items': [],
+    }
+    for item in items:
+        entry = {
+            'id': item['link'],
+            'url': item['link'],
+            'title': item['title'],
+            'content_text': describe(item),
+            'date_published': item_date(item).isoformat(),
+            'date_modified': item_updated(item).isoformat(),
+            'tags': [item['category']] + [str(t) for t in item.get('tags', [])],
+        }
+        feed['items'].append(entry)
+    return json.dumps(feed, indent=1, ensure_ascii=False) + '\n'
+
+
+def render_atom(items):
+    """Atom feed; the feed's <updated> is the newest entry's, so it only moves with the items."""
+    updated = max((item_updated(item) for item in items), default=datetime(1970, 1, 1, tzinfo=IST))
+    f = io.BytesIO()
+    xml = XMLGenerator(f, encoding='UTF-8', short_empty_elements=True)
+    xml.startDocument()
+    xml.startElement('feed', {'xmlns': 'http://www.w3.org/2005/Atom'})
+    xml.ignorableWhitespace('\n')
+    _text_element(xml, 'title', FEED_TITLE)
+    _text_element(xml, 'subtitle', FEED_DESCRIPTION)
+    _text_element(xml, 'id', f'{SITE_URL}/')
+    xml.startElement('link', {'href': f'{SITE_URL}/'})
+    xml.endElement('link')
+    xml.ignorableWhitespace('\n')
+    xml.startElement('link', {'rel': 'self', 'href': f'{SITE_URL}/{ATOM_FILE}'})
+    xml.endElement('link')
+    xml.ignorableWhitespace('\n')
+    _text_element(xml, 'updated', updated.isoformat())
+    xml.startElement('author', {})
+    _text_element(xml, 'name', AUTHOR)
+    xml.endElement('author')
+    xml.ignorableWhitespace('\n')
+
+    for item in items:
+        xml.startElement('entry', {})
+        xml.ignorableWhitespace('\n')
+        _text_element(xml, 'title', item['title'])
+        xml.startElement('link', {'href': item['link']})
+        xml.endElement('link')
+        xml.ignorableWhitespace('\n')
+        _text_element(xml, 'id', item['link'])
+        _text_element(xml, 'published', item_date(item).isoformat())
+        _text_element(xml, 'updated', item_updated(item).isoformat())
+        _text_element(xml, 'summary', describe(item))
+        xml.startElement('category', {'term': item['category']})
+        xml.endElement('category')
+        xml.ignorableWhitespace('\n')
+        xml.endElement('entry')
+        xml.ignorableWhitespace('\n')
+
+    xml.endElement('feed')
+    xml.ignorableWhitespace('\n')
+    xml.endDocument()
+    return f.getvalue()
+
+
+# --- Accumulating ---
+
+class FeedSet:
+    """The newest items of every feed and the sitemap's lastmods, from one pass.
+
+    Each feed is a min-heap of at most `limit` (date, -arrival, item)
+    entries, so ties keep the items that came first, as heapq.nlargest
+    does. Sitemap pages get their item's date; listing pages (the home
+    page, section indexes, tag and series pages) the newest date of the
+    pages they list.
+    """
+
+    def __init__(self, limit=MAX_ITEMS):
+        self.limit = limit
+        self.site = []
+        self.categories = {category: [] for category in CATEGORIES}
+        self.tags = {}
+        self.lastmod = {}
+        self._arrivals = 0
+
+    def add(self, item, site=True):
+        """Offer `item` to its feeds (and to the site feed unless not `site`) and the sitemap."""
+        self._arrivals += 1
+        entry = (item_date(item), -self._arrivals, item)
+        feeds = [self.categories.get(item['category'])]
+        feeds += [self.tags.setdefault(str(tag), []) for tag in item.get('tags', [])]
+        if site:
+            feeds.append(self.site)
+        for heap in feeds:
+            if heap is None:
+                continue
+            if len(heap) < self.limit:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+        if item.get('page'):
+            date = item_updated(item)
+            self.touch(item['page'], date)
+            self.touch(f'{SITE_URL}/', date)
+            self.touch(f"{SITE_URL}/{item['category']}/", date)
+            for tag in item.get('tags', []):
+                self.touch(f'{SITE_URL}/weblog/tags/{tag_slug(tag)}.html', date)
+            if item.get('collection'):
+                self.touch(f"{SITE_URL}/weblog/series/{series_slug(item['collection'])}/", date)
+
+    def touch(self, url, date):
+        """List `url` in the sitemap, last modified at `date` or later."""
+        if url not in self.lastmod or self.lastmod[url] < date:
+            self.lastmod[url] = date
+
+    @staticmethod
+    def newest(heap):
+        """A feed's items, newest first."""
+        return [item for _, _, item in sorted(heap, key=lambda entry: entry[:2], reverse=True)]
+
+    def sitemap_entries(self):
+        return sorted(self.lastmod.items())
+
+
+# --- Sitemap ---
+
+def render_sitemap(entries):
+    f = io.BytesIO()
+    xml = XMLGenerator(f, encoding='UTF-8')
+    xml.startDocument()
+    xml.startElement('urlset', {'xmlns': 'http://www.sitemaps.org/schemas/sitemap/0.9'})
+    xml.ignorableWhitespace('\n')
+    for url, date in entries:
+        xml.startElement('url', {})
+        _text_element(xml, 'loc', url)
+        _text_element(xml, 'lastmod', date.isoformat())
+        xml.endElement('url')
+        xml.ignorableWhitespace('\n')
+    xml.endElement('urlset')
+    xml.ignorableWhitespace('\n')
+    xml.endDocument()
+    return f.getvalue()
+
+
+# --- All outputs ---
+
+def _prune(directory, keep):
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith('.xml') and name not in keep:
+            os.remove(os.path.join(directory, name))
+
+
+def write_feeds(main_items, feeds):
+    """Write every feed and the sitemap; return {output: written?}.
+
+    `main_items` is the site feed (newest first, already merged with the
+    published rss.xml); `feeds` is the FeedSet the current items were
+    added to, from which the category and tag feeds and the sitemap are
+    drawn.
+    """
+    written = {
+        RSS_FILE: write_rss(main_items),
+        JSON_FEED_FILE: write_if_changed(JSON_FEED_FILE, render_json_feed(main_items)),
+        ATOM_FILE: write_if_changed(ATOM_FILE, render_atom(main_items)),
+    }
+
+    for category in CATEGORIES:
+        path = os.path.join(FEEDS_DIR, f"{category}.xml")
+        written[path] = write_rss(feeds.newest(feeds.categories[category]), path,
+                                  title=f"{FEED_TITLE}: {category}",
+                                  description=f"RSS feed for {category} updates.")
+
+    tags_dir = os.path.join(FEEDS_DIR, 'tags')
+    for tag, tagged in sorted(feeds.tags.items()):
+        path = os.path.join(tags_dir, f"{tag_slug(tag)}.xml")
+        written[path] = write_rss(feeds.newest(tagged), path, title=f"{FEED_TITLE}: #{tag}",
+                                  description=f"Weblog posts tagged {tag}.",
+                                  link=f"{SITE_URL}/weblog/tags/{tag_slug(tag)}.html")
+    _prune(tags_dir, {f"{tag_slug(tag)}.xml" for tag in feeds.tags})
+
+    written[SITEMAP_FILE] = write_if_changed(SITEMAP_FILE, render_sitemap(feeds.sitemap_entries()))
+    return written
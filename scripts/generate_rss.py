@@ -1,193 +1,230 @@
 import os
 import glob
-import yaml
-from datetime import datetime, timedelta, timezone
+import argparse
+import heapq
+from datetime import datetime
+from functools import partial
+from itertools import chain, islice
 import re
-from xml.sax.saxutils import escape
-from bs4 import BeautifulSoup, BeautifulStoneSoup
-from typing import Dict, List, Optional
-from urllib.parse import urlparse
-
-SITE_URL = "https://gaurv.me"
-RSS_FILE = "rss.xml"
-IST = timezone(timedelta(hours=5, minutes=30))
-
-def parse_frontmatter(md_file):
-    with open(md_file, encoding="utf-8") as f:
-        content = f.read()
-    try:
-        _, fm, body = content.split('---', 2)
-        meta = yaml.safe_load(fm)
-        return meta, body
-    except Exception:
-        return None, None
-
-def parse_date_from_filename(filename):
-    base = os.path.basename(filename)
-    parts = base.split('-')
-    if len(parts) >= 3 and parts[0].isdigit() and parts[1].isdigit() and parts[2].isdigit():
-        year, month, day = parts[0], parts[1], parts[2]
-        return datetime(int(year), int(month), int(day), tzinfo=IST)
-    else:
-        return datetime.now(IST)
+from typing import List
+
+from content import IST, SITE_URL, file_dates, load_posts
+from feeds import MAX_ITEMS, RSS_DATE_FORMAT, RSS_FILE, SUMMARY_CHARS, FeedSet, write_feeds
+from navigation import PAGE_SIZE, archive_pages, series_names, tag_slug
+from output import stats as output_stats
+from page_meta import html_summary, iter_feed_items, read_head_meta, read_projects, read_summary
+import profiling
+from render_cache import CACHE_FILE, MARKDOWN_EXTENSIONS, NullCache, open_cache, render_markdown
 
 # ----------- Blog posts (HTML-based) -----------
-blog_posts = []
-for html_file in sorted(glob.glob("blog/*.html")):
-    if os.path.basename(html_file) == "index.html":
-        continue
-    with open(html_file, encoding="utf-8") as f:
-        soup = BeautifulSoup(f, "html.parser")
-        title = soup.title.string.strip() if soup.title else os.path.splitext(os.path.basename(html_file))[0]
+def collect_blog_posts():
+    for html_file in sorted(glob.glob("blog/*.html")):
+        if os.path.basename(html_file) == "index.html":
+            continue
+        title, description = read_head_meta(html_file)
         slug = os.path.splitext(os.path.basename(html_file))[0]
+        title = title.strip() if title is not None else slug
         url = f"{SITE_URL}/blog/{slug}.html"
-        description = soup.find("meta", attrs={"name": "description"})
-        desc_text = description["content"].strip() if description else ""
-        mtime = os.path.getmtime(html_file)
-        pub_date = datetime.fromtimestamp(mtime, tz=IST)
-        blog_posts.append({
+        # Without a meta description, the opening paragraphs are read once the item is used
+        desc_text = description.strip() if description and description.strip() else None
+        pub_date, updated = file_dates(html_file)
+        yield {
             "title": title,
             "link": url,
-            "description": escape(desc_text),
+            "description": desc_text,
+            "summary": partial(read_summary, html_file, SUMMARY_CHARS),
             "pubDate_obj": pub_date,
-            "pubDate": pub_date.strftime('%a, %d %b %Y %H:%M:%S %z'),
-            "category": "blog"
-        })
+            "pubDate": pub_date.strftime(RSS_DATE_FORMAT),
+            "updated": updated,
+            "category": "blog",
+            "page": url,
+        }
 
 # ----------- weblog posts (Markdown) -----------
-weblog_posts = []
-for md_file in sorted(glob.glob("weblog/posts/*.md")):
-    meta, body = parse_frontmatter(md_file)
-    if not meta:
-        continue
-    filename = os.path.basename(md_file)
-    name = os.path.splitext(filename)[0]
+def legacy_feed_slug(post):
+    # Feeds used to link /weblog/p/<file name slug>/, which was never a page
+    name = os.path.splitext(post.filename)[0]
     match = re.match(r'^\d{4}-\d{2}-\d{2}-(.+)', name)
-    slug = match.group(1) if match else name
-    date_obj = parse_date_from_filename(md_file)
-    url = f"{SITE_URL}/weblog/p/{slug}/"
-    weblog_posts.append({
-        "title": meta.get("title", slug.replace('-', ' ').title()),
-        "link": url,
-        "description": escape(body[:180]),
-        "pubDate": date_obj.strftime('%a, %d %b %Y %H:%M:%S %z'),
-        "category": "weblog"
-    })
+    return match.group(1) if match else name
+
+# Render cache shared with generate_til (same file, same keys); open while
+# generate_rss() runs
+render_cache = NullCache()
+
+def post_summary(post):
+    """Plain-text summary of a post from its rendered HTML.
+
+    Uses the body rendered in this run if there is one, else the post
+    page written by an earlier build; only renders the Markdown when
+    neither exists, the way the pages do and through the render cache.
+    """
+    if post.body is not None:
+        return html_summary(post.body, SUMMARY_CHARS)
+    if os.path.exists(post.output_path):
+        return read_summary(post.output_path, SUMMARY_CHARS)
+    body = render_markdown(post.load_markdown(), render_cache, extensions=MARKDOWN_EXTENSIONS, math=True)
+    return html_summary(body, SUMMARY_CHARS)
+
+def collect_weblog_posts(posts):
+    series = series_names(posts)
+    for post in posts:
+        url = f"{SITE_URL}/weblog/posts/{post.slug}/"
+        yield {
+            "title": post.title,
+            "link": url,
+            "aliases": [f"{SITE_URL}/weblog/p/{legacy_feed_slug(post)}/"],
+            "description": None,
+            "summary": partial(post_summary, post),
+            "pubDate_obj": post.date,
+            "pubDate": post.date.strftime(RSS_DATE_FORMAT),
+            "updated": post.updated,
+            "category": "weblog",
+            "tags": post.tags,
+            # Only a series has a page for the sitemap
+            "collection": post.collection if str(post.collection) in series else None,
+            "page": url,
+        }
 
 # ----------- Code Projects (from HTML listing) -----------
-code_projects = []
-code_html = "code/index.html"
-if os.path.exists(code_html):
-    mtime = os.path.getmtime(code_html)
-    code_pub_date = datetime.fromtimestamp(mtime, tz=IST)
-    with open(code_html, encoding="utf-8") as f:
-        soup = BeautifulSoup(f, "html.parser")
-        for div in soup.select(".project"):
-            a = div.find("a")
-            desc = div.find(class_="subheading")
-            if a:
-                code_projects.append({
-                    "title": a.text.strip(),
-                    "link": a["href"],
-                    "description": escape(desc.text.strip() if desc else ""),
-                    "pubDate_obj": code_pub_date,
-                    "pubDate": code_pub_date.strftime('%a, %d %b %Y %H:%M:%S %z'),
-                    "category": "code"
-                })
-
-# ----------- Combine All -----------
-all_items = blog_posts + weblog_posts + code_projects
-all_items.sort(key=lambda x: x.get("pubDate_obj") or datetime.strptime(x["pubDate"], '%a, %d %b %Y %H:%M:%S %z'), reverse=True)
-
-def get_existing_feed_items() -> Dict[str, dict]:
-    """Read existing RSS feed and return a dictionary of items keyed by link."""
-    if not os.path.exists(RSS_FILE):
-        return {}
-    
-    with open(RSS_FILE, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    soup = BeautifulStoneSoup(content, 'xml')
-    items = {}
-    
-    for item in soup.find_all('item'):
-        link = item.find('link')
-        if link and link.text:
-            items[link.text] = {
-                'title': item.find('title').text if item.find('title') else '',
-                'description': item.find('description').text if item.find('description') else '',
-                'pubDate': item.find('pubDate').text if item.find('pubDate') else '',
-                'category': item.find('category').text if item.find('category') else ''
+def collect_code_projects():
+    code_html = "code/index.html"
+    if os.path.exists(code_html):
+        # Projects are listed on one page: they are dated by its last change
+        _, code_pub_date = file_dates(code_html)
+        for project in read_projects(code_html):
+            yield {
+                "title": project["title"],
+                "link": project["href"],
+                "description": project["description"],
+                "pubDate_obj": code_pub_date,
+                "pubDate": code_pub_date.strftime(RSS_DATE_FORMAT),
+                "category": "code",
+                # The page the project is listed on
+                "page": f"{SITE_URL}/code/",
             }
-    return items
 
-def generate_rss():
-    # Get existing feed items
-    existing_items = get_existing_feed_items()
-    
-    # Combine and sort all items
-    combined_items = blog_posts + weblog_posts + code_projects
-    
-    # Create a dictionary of new items, preserving existing ones
-    all_items = {}
-    
-    # First add existing items to preserve their order and dates
-    for link, item in existing_items.items():
-        all_items[link] = item
-    
-    # Then add/update with new items
-    for item in combined_items:
-        link = item['link']
-        if link not in all_items:  # Only add if it's a new item
-            all_items[link] = {
-                'title': item['title'],
-                'description': item['description'],
-                'pubDate': item.get('pubDate', datetime.now(IST).strftime('%a, %d %b %Y %H:%M:%S %z')),
-                'category': item['category']
-            }
-    
-    # Convert to list and sort by date
-    sorted_items = []
-    for link, item in all_items.items():
-        pub_date = item.get('pubDate', '')
-        pub_date_obj = None
+def item_date(item):
+    """Parsed pubDate of a feed item, cached on the item; unparseable dates become now."""
+    if item.get('pubDate_obj') is None:
         try:
-            pub_date_obj = datetime.strptime(pub_date, '%a, %d %b %Y %H:%M:%S %z')
+            item['pubDate_obj'] = datetime.strptime(item.get('pubDate', ''), RSS_DATE_FORMAT)
         except (ValueError, TypeError):
-            pub_date_obj = datetime.now(IST)
-            pub_date = pub_date_obj.strftime('%a, %d %b %Y %H:%M:%S %z')
-        
-        sorted_items.append({
-            'title': item['title'],
-            'link': link,
-            'description': item['description'],
-            'pubDate': pub_date,
-            'category': item['category'],
-            'pubDate_obj': pub_date_obj
-        })
-    
-    # Sort by date, newest first
-    sorted_items.sort(key=lambda x: x['pubDate_obj'], reverse=True)
-    
-    # Write the RSS feed
-    with open(RSS_FILE, 'w', encoding='utf-8') as f:
-        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-        f.write('<rss version="2.0">\n<channel>\n')
-        f.write('<title>Gaurav - updates</title>\n')
-        f.write(f'<link>{SITE_URL}/</link>\n')
-        f.write('<description>RSS feed for blog, weblogs, and code updates.</description>\n')
-        f.write(f'<lastBuildDate>{datetime.now(IST).strftime("%a, %d %b %Y %H:%M:%S %z")}</lastBuildDate>\n')
-        
-        for item in sorted_items[:30]:  # Limit to 30 most recent items
-            f.write('<item>\n')
-            f.write(f'<title>{escape(item["title"])}</title>\n')
-            f.write(f'<link>{item["link"]}</link>\n')
-            f.write(f'<description>{item["description"]}</description>\n')
-            f.write(f'<pubDate>{item["pubDate"]}</pubDate>\n')
-            f.write(f'<category>{item["category"]}</category>\n')
-            f.write('</item>\n')
-        
-        f.write('</channel>\n</rss>\n')
-
-# Generate the RSS feed
-generate_rss()
+            item['pubDate_obj'] = datetime.now(IST)
+            item['pubDate'] = item['pubDate_obj'].strftime(RSS_DATE_FORMAT)
+    return item['pubDate_obj']
+
+def get_existing_feed_items() -> List[dict]:
+    """Read the existing RSS feed, newest first (as it was written)."""
+    if not os.path.exists(RSS_FILE):
+        return []
+
+    items = [item for item in iter_feed_items(RSS_FILE) if item['link']]
+    dates = [item_date(item) for item in items]
+    if any(newer < older for older, newer in zip(dates, dates[1:])):
+        # Hand-edited or foreign feed: restore the order the merge relies on
+        items.sort(key=item_date, reverse=True)
+    return items
+
+def unique_items(candidates):
+    """Candidates with duplicate links dropped (the first one wins), as a stream."""
+    seen = set()
+    for item in candidates:
+        if item['link'] not in seen:
+            seen.add(item['link'])
+            yield item
+
+def merge_feed_items(existing, candidates, feeds, limit=MAX_ITEMS):
+    """Newest `limit` items out of the existing feed plus the current candidates.
+
+    A candidate already in the feed (under its link or one of its
+    'aliases', links it was published under before) keeps its published
+    date (set on the candidate itself, so every feed made from it agrees)
+    but takes its other fields from the source. Items only found in the
+    existing feed are kept, except weblog posts: every current post is a
+    candidate, so those were deleted. Candidates are consumed as a stream
+    and added to `feeds` (a FeedSet, whose heaps never hold more than
+    `limit` items each), then the kept items, which are already in the
+    site feed. The already sorted feed is merged in rather than re-sorted.
+    Returns the site feed's items.
+    """
+    published = {item['link']: item for item in existing}
+    for item in candidates:
+        old = published.pop(item['link'], None)
+        for alias in item.get('aliases', ()):
+            old = published.pop(alias, None) or old
+        if old:
+            item['pubDate'], item['pubDate_obj'] = old['pubDate'], item_date(old)
+        feeds.add(item)
+    kept = [item for item in existing if item['link'] in published and item['category'] != 'weblog']
+    for item in kept:
+        feeds.add(item, site=False)
+    return list(islice(heapq.merge(kept, feeds.newest(feeds.site), key=item_date, reverse=True), limit))
+
+def archive_entries(posts, page_size=PAGE_SIZE):
+    """(url, lastmod) of the archive pages of the weblog and of each tag.
+
+    Mirrors the pagination of generate_til: page k of a listing holds the
+    same posts there, and is as new as the newest post on it.
+    """
+    posts = sorted(posts, key=lambda p: p.date)
+    listings = {'weblog': posts}
+    for post in posts:
+        for tag in post.tags:
+            listings.setdefault(f"weblog/tags/{tag_slug(tag)}", []).append(post)
+    for base, listed in listings.items():
+        for k, page in archive_pages(listed, page_size):
+            yield f"{SITE_URL}/{base}/page/{k}/", max(p.updated for p in page)
+
+def generate_rss(candidates, pages=(), use_cache=True, cache_path=CACHE_FILE):
+    """Merge candidate items into rss.xml, keeping the MAX_ITEMS newest, and write the other feeds.
+
+    `pages` are extra (url, lastmod) sitemap entries for pages no item
+    describes (the archive pages). Summaries that need a post rendered
+    go through the render cache at `cache_path` unless not `use_cache`.
+    """
+    with profiling.stage('read'):
+        existing = get_existing_feed_items()
+    # Candidates are generators, so reading blog/ and code/ pages is timed as part of the merge
+    feeds = FeedSet()
+    with profiling.stage('merge'):
+        items = merge_feed_items(existing, unique_items(candidates), feeds)
+        for url, date in pages:
+            feeds.touch(url, date)
+    global render_cache
+    render_cache = open_cache(use_cache, cache_path)
+    try:
+        with profiling.stage('write'):
+            written = write_feeds(items, feeds)
+    finally:
+        render_cache.close()
+        render_cache = NullCache()
+    print(f"RSS feed {'updated' if written[RSS_FILE] else 'unchanged'}: {len(items)} items; "
+          f"feeds and sitemap: {sum(written.values())}/{len(written)} written")
+
+def build(posts, page_size=PAGE_SIZE, use_cache=True, cache_path=CACHE_FILE):
+    """Generate rss.xml and the other feeds from already loaded weblog posts plus the blog and code pages.
+
+    `page_size` is the one the weblog pages were built with, for the
+    archive pages listed in the sitemap; `use_cache` and `cache_path`
+    are those of the render cache, as for generate_til.build().
+    """
+    generate_rss(chain(collect_blog_posts(), collect_weblog_posts(posts), collect_code_projects()),
+                 archive_entries(posts, page_size), use_cache, cache_path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge blog, weblog and code updates into rss.xml and write the other feeds and the sitemap")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="render summaries from scratch without reading or filling the render cache")
+    parser.add_argument('--cache', default=CACHE_FILE,
+                        help=f"render cache location (default: {CACHE_FILE})")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    with profiling.session(args):
+        with profiling.stage('load'):
+            posts = load_posts()
+        with profiling.stage('rss'):
+            build(posts, use_cache=not args.no_cache, cache_path=args.cache)
+    print(output_stats.summary())
+
+if __name__ == '__main__':
+    main()
@@ -1,410 +1,504 @@
 import os
-import glob
+import argparse
+import shutil
 import markdown
-import yaml
 from collections import defaultdict
-from datetime import datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor
 import re
-import uuid
+import time
+import zlib
+
+from assets import AssetPipeline, page_asset_groups
+from build_manifest import MANIFEST_FILE, Manifest, generator_fingerprint, hash_json
+from content import load_posts
+from images import ImagePipeline
+from minify import PageOptimizer, stylesheet_tags
+from navigation import (PAGE_SIZE, PostIndex, archive_pages, check_tag_slugs, older_page_number, prune_series,
+                        series_path, series_slug, tag_slug)
+from output import stats as output_stats
+import profiling
+from related import compute_related, write_related_graph
+from render_cache import CACHE_FILE, NullCache, open_cache, render_markdown
+from search_index import build_search_index
+import templates
 
 # --- Code block features ---
 
-SCRIPT_ADDITIONS = '''
-<script>
-function copyCode(button, preId) {
-    const preElement = document.getElementById(preId);
-    if (preElement) {
-        const codeElement = preElement.querySelector('code');
-        if (!codeElement) return;
-        const codeText = codeElement.innerText;
-        navigator.clipboard.writeText(codeText).then(() => {
-            const originalContent = button.innerHTML;
-            button.innerHTML = 'Copied!';
-            button.disabled = true;
-            setTimeout(() => {
-                button.innerHTML = originalContent;
-                button.disabled = false;
-            }, 2000);
-        }).catch(err => {
-            console.error('Failed to copy code: ', err);
-            const originalContent = button.innerHTML;
-            button.innerHTML = 'Error!';
-            button.disabled = true;
-            setTimeout(() => {
-                button.innerHTML = originalContent;
-                button.disabled = false;
-            }, 2000);
-        });
-    }
-}
-</script>'''
+CLIPBOARD_SVG = '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M16 4h2a2 2 0 0 1 2 2v14a2 2 0 0 1-2 2H6a2 2 0 0 1-2-2V6a2 2 0 0 1 2-2h2"></path><rect x="8" y="2" width="8" height="4" rx="1" ry="1"></rect></svg>'
+
+CODEHILITE_RE = re.compile(r'<div class="codehilite([^"]*)">')
+LANGUAGE_RE = re.compile(r'language-([^\s"]+)')
+
+def code_block_id(html_content, start, end, seen):
+    """Content-derived ID for a code block, so rebuilds produce the same anchors."""
+    digest = zlib.crc32(html_content[start:end].encode('utf-8'))
+    block_id = f"code-block-{digest & 0xffffff:06x}"
+    count = seen.get(block_id, 0) + 1
+    seen[block_id] = count
+    # Identical snippets in one post still need distinct anchors
+    return block_id if count == 1 else f"{block_id}-{count}"
 
 def add_code_block_features(html_content):
-    """Add copy button and other features to code blocks."""
-    processed_html = ""
+    """Add copy button and other features to code blocks.
+
+    Single pass over the document: each codehilite container is located
+    once and emitted as slices of the input into a list that is joined at
+    the end, instead of re-slicing and concatenating every block.
+    """
+    out = []
+    append = out.append
     last_end = 0
-    pattern = re.compile(r'<div class="codehilite[^"]*">')
-    
-    for match in pattern.finditer(html_content):
+    seen = {}
+
+    for match in CODEHILITE_RE.finditer(html_content):
         start = match.start()
-        processed_html += html_content[last_end:start]
-        
+        if start < last_end:
+            continue
         end_div_pos = html_content.find('</div>', start)
         if end_div_pos == -1:
-            processed_html += html_content[start:]
-            last_end = len(html_content)
             break
-
         end = end_div_pos + len('</div>')
-        code_block_html = html_content[start:end]
-        
-        lang_match = re.search(r'language-([^\s"]+)', code_block_html)
-        lang = lang_match.group(1) if lang_match else ''
-        
-        block_id = f"code-block-{uuid.uuid4().hex[:6]}"
-        
-        clipboard_svg = '<svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M16 4h2a2 2 0 0 1 2 2v14a2 2 0 0 1-2 2H6a2 2 0 0 1-2-2V6a2 2 0 0 1 2-2h2"></path><rect x="8" y="2" width="8" height="4" rx="1" ry="1"></rect></svg>'
+        append(html_content[last_end:match.start(1)])
+        append('-container codehilite')
 
-        toolbar_html = f'''<div class="code-toolbar">
+        lang_match = LANGUAGE_RE.search(html_content, start, end)
+        lang = lang_match.group(1) if lang_match else ''
+        block_id = code_block_id(html_content, start, end, seen)
+
+        pre_pos = html_content.find('<pre', start, end)
+        if pre_pos == -1:
+            append(html_content[match.start(1):end])
+        else:
+            append(html_content[match.start(1):pre_pos])
+            append(f'''<div class="code-toolbar">
     <span class="language-name">{lang}</span>
     <button class="copy-btn" onclick="copyCode(this, \'{block_id}\')" aria-label="Copy code to clipboard">
-        {clipboard_svg}
+        {CLIPBOARD_SVG}
     </button>
     <a class="anchor-link" href="#{block_id}" aria-label="Link to this code block">🔗</a>
-</div>'''
-        
-        modified_block = code_block_html.replace('class="codehilite', 'class="codehilite-container codehilite', 1)
-        
-        pre_pos = modified_block.find('<pre')
-        if pre_pos != -1:
-            modified_block = modified_block[:pre_pos] + toolbar_html + modified_block[pre_pos:]
-            new_pre_pos = modified_block.find('<pre', pre_pos + len(toolbar_html))
-            modified_block = modified_block[:new_pre_pos+4] + f' id="{block_id}"' + modified_block[new_pre_pos+4:]
-
-        processed_html += modified_block
+</div><pre id="{block_id}"''')
+            append(html_content[pre_pos + 4:end])
         last_end = end
-        
-    processed_html += html_content[last_end:]
-    
-    # Add the copy code script if not already present
-    if 'function copyCode(' not in processed_html:
-        processed_html += SCRIPT_ADDITIONS
-        
-    return processed_html
+
+    append(html_content[last_end:])
+    # copyCode() itself lives in the shared assets/copy-code.js (see assets.py)
+    return ''.join(out)
 
 # --- Main script ---
 
-POSTS_DIR = 'weblog/posts'
 TAGS_DIR = 'weblog/tags'
+WEBLOG_DIR = 'weblog'
 INDEX_FILE = 'weblog/index.html'
 STYLE_FILE = 'weblog/weblog-style.css'
 
-os.makedirs(TAGS_DIR, exist_ok=True)
-
-posts = []
-tags_dict = defaultdict(list)
-
-# Helper for IST
-IST = timezone(timedelta(hours=5, minutes=30))
-
 def slugify(text):
     return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
 
-def parse_slug_from_filename(filename):
-    # expects yyyy-mm-dd-slug.md or slug.md
-    base = os.path.basename(filename)
-    if base.count('-') >= 3 and base[:4].isdigit():
-        parts = base.split('-')
-        slug = '-'.join(parts[3:]).replace('.md', '')
-    else:
-        slug = base.replace('.md', '')
-    return slug
-
-def parse_date_from_filename(filename):
-    # expects yyyy-mm-dd-slug.md
-    base = os.path.basename(filename)
-    parts = base.split('-')
-    if len(parts) >= 3 and parts[0].isdigit() and parts[1].isdigit() and parts[2].isdigit():
-        year, month, day = parts[0], parts[1], parts[2]
-        return datetime(int(year), int(month), int(day), tzinfo=IST)
-    else:
-        return datetime.now(IST)
-
-# Parse all weblog markdown files
-for md_file in sorted(glob.glob(f"{POSTS_DIR}/*.md")):
-    with open(md_file, encoding="utf-8") as f:
-        content = f.read()
-    try:
-        _, fm, body = content.split('---', 2)
-    except ValueError:
-        print(f"Skipping {md_file}: invalid frontmatter")
-        continue
-    meta = yaml.safe_load(fm)
-    # Get slug from frontmatter or generate from filename
-    slug = meta.get('slug', parse_slug_from_filename(md_file))
-    # Get date from filename if present, else use now
-    date_obj = parse_date_from_filename(md_file)
-    html_body = markdown.markdown(body, extensions=['fenced_code', 'codehilite'])
+# Render cache of the current process; set by init_render_cache() in the
+# parent and in every pool worker.
+render_cache = NullCache()
+
+def init_render_cache(enabled=True, path=CACHE_FILE):
+    global render_cache
+    render_cache = open_cache(enabled, path)
+
+# Minifies pages and inlines their critical CSS; None writes them as rendered
+page_optimizer = None
+# Site-relative URL of the fingerprinted weblog stylesheet (see assets.py)
+stylesheet_url = None
+
+def page_signature():
+    """Part of every page signature: how pages are post-processed and the stylesheet they link."""
+    return [page_optimizer.signature if page_optimizer else None, stylesheet_url]
+
+def render_page(name, path, context, slug=None):
+    """Render template `name` into `path`; return True if the file was written."""
+    template = templates.get(name)
+    # context['root'] leads to weblog/, one level below the site root
+    href = f"{context['root']}../{stylesheet_url}"
+    if page_optimizer is None:
+        context['stylesheet'] = stylesheet_tags(href)
+        return template.render_to(path, context, slug)
+    return page_optimizer.render_to(template, path, context, href, slug)
+
+def render_post_body(body):
+    """Render one Markdown post body to HTML; return (html, stage timings).
+
+    Runs in worker processes, so it only takes and returns plain values.
+    """
+    start = time.perf_counter()
+    html_body = render_markdown(body, render_cache, extensions=['fenced_code', 'codehilite'], math=True)
+    rendered = time.perf_counter()
     html_body = add_code_block_features(html_body)
-    post = {
-        'title': meta['title'],
-        'weblog_title': meta.get('weblog_title', meta['title']),
-        'date': date_obj,
-        'date_str': date_obj.strftime('%Y-%m-%d'),
-        'tags': meta.get('tags', []),
-        'collection': meta.get('collection', None),
-        'body': html_body,
-        'filename': os.path.basename(md_file),
-        'slug': slug
-    }
-    posts.append(post)
-    for tag in post['tags']:
-        tags_dict[tag].append(post)
-
-# Sort posts by date ascending for navigation (oldest to newest)
-posts.sort(key=lambda p: p['date'])
-
-# Generate individual post pages
-for post in posts:
-    post_dir = os.path.join('weblog', 'posts', post['slug'])
-    os.makedirs(post_dir, exist_ok=True)
-    
-    with open(os.path.join(post_dir, 'index.html'), 'w', encoding="utf-8") as f:
-        f.write(f"""<!DOCTYPE html>
-<html>
-<head>
-  <link rel="stylesheet" href="../../weblog-style.css">
-  <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/prismjs@1.29.0/themes/prism.min.css">
-  <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/katex.min.css">
-  <script defer src="https://cdn.jsdelivr.net/npm/prismjs@1.29.0/prism.min.js"></script>
-  <script defer src="https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/katex.min.js"></script>
-  <script defer src="https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/contrib/auto-render.min.js"></script>
-  <script>
-    document.addEventListener("DOMContentLoaded", function() {{
-      if (window.renderMathInElement) {{
-        renderMathInElement(document.body, {{
-          delimiters: [
-            {{left: '$$', right: '$$', display: true}},
-            {{left: '$', right: '$', display: false}}
-          ]
-        }});
-      }}
-    }});
-  </script>
-  <title>{post['title']}</title>
-</head>
-<body>
-  <div class="weblog-post">
-    <h1>{post['title']}</h1>
-    <div class="weblog-meta">
-      <span class="weblog-date">{post['date_str']}</span>
-      <span class="weblog-tags">
-        {''.join(f'<a href="../../tags/{tag}.html" class="weblog-tag">{tag}</a>' for tag in post['tags'])}
-      </span>
-    </div>
-    <div class="weblog-content">
-      {post['body']}
-    </div>
-    <div class="weblog-footer">
-      <a href="../../" class="weblog-back">← Back to all posts</a>
-    </div>
-  </div>
-  {SCRIPT_ADDITIONS}
-</body>
-</html>""")
-
-
-# Generate tag pages
-for tag, tag_posts in tags_dict.items():
-    tag_posts_sorted = sorted(tag_posts, key=lambda p: p['date'], reverse=True)
-    with open(f"{TAGS_DIR}/{tag}.html", 'w', encoding="utf-8") as f:
-        f.write(f"""<!DOCTYPE html>
-<html>
-<head>
-  <link rel="stylesheet" href="../weblog-style.css">
-  <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/prismjs@1.29.0/themes/prism.min.css">
-  <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/katex.min.css">
-  <script defer src="https://cdn.jsdelivr.net/npm/prismjs@1.29.0/prism.min.js"></script>
-  <script defer src="https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/katex.min.js"></script>
-  <script defer src="https://cdn.jsdelivr.net/npm/katex@0.16.9/dist/contrib/auto-render.min.js"></script>
-  <script>
-    document.addEventListener("DOMContentLoaded", function() {{
-      if (window.renderMathInElement) {{
-        renderMathInElement(document.body, {{
-          delimiters: [
-            {{left: '$$', right: '$$', display: true}},
-            {{left: '$', right: '$', display: false}}
-          ]
-        }});
-      }}
-    }});
-  </script>
-  <title>Weblog: {tag}</title>
-</head>
-<body>
-  <h1>#{tag}</h1>
-  <ul class="weblog-list"><li><a href="../">← LOGS</a></li>""")
-        for post in tag_posts_sorted:
-            url = f"../posts/{post['slug']}/"
-            f.write(f'<li><a href="{url}">{post["title"]}</a> <span class="weblog-date">{post["date_str"]}</span></li>\n')
-        f.write(f"</ul>\n{SCRIPT_ADDITIONS}</body></html>")
-
-# Generate main index.html (recent weblogs: newest first)
-posts_desc = sorted(posts, key=lambda p: p['date'], reverse=True)
-
-# Read the existing index.html to preserve its structure
-with open(INDEX_FILE, 'r', encoding="utf-8") as f:
-    content = f.read()
-
-# Find the tags div and replace its content
-tags_start = content.find('<div class="weblog-tags"')
-tags_end = content.find('</div>', tags_start) + len('</div>')
-
-# Generate new tags content
-new_tags = []
-for tag, tag_posts in sorted(tags_dict.items()):
-    new_tags.append(f'<button class="weblog-tag" data-tag="{tag}" onclick="toggleTag(this)">{tag} ({len(tag_posts)})</button>')
-
-# Generate recent posts
-recent_posts = []
-for post in posts_desc[:10]:
-    url = f"posts/{post['slug']}/"
-    tags_str = ','.join(post['tags'])
-    recent_posts.append(f'<li data-tags="{tags_str}"><a href="{url}">{post["title"]}</a> <span class="weblog-date">{post["date_str"]}</span></li>')
-
-# Generate all posts for search
-all_posts = []
-for post in posts_desc:
-    url = f"posts/{post['slug']}/"
-    tags_str = ','.join(post['tags'])
-    all_posts.append(f'<li data-tags="{tags_str}"><a href="{url}">{post["title"]}</a> <span class="weblog-date">{post["date_str"]}</span></li>')
-
-# Replace the tags section
-new_content = (
-    content[:tags_start] +
-    f'<div class="weblog-tags" role="region" aria-label="Post tags">\n' +
-    '\n'.join(new_tags) +
-    '\n</div>\n' +
-    content[tags_end:]
-)
-
-# Replace the recent posts list
-recent_start = new_content.find('<ul class="weblog-list" id="weblog-list">') + len('<ul class="weblog-list" id="weblog-list">')
-recent_end = new_content.find('</ul>', recent_start)
-new_content = (
-    new_content[:recent_start] +
-    '\n' + '\n'.join(recent_posts) + '\n' +
-    new_content[recent_end:]
-)
-
-# Replace the all posts list (for search)
-all_start = new_content.find('<ul class="weblog-list" id="all-weblogs"')
-if all_start > 0:  # Only if the all-weblogs list exists
-    all_start = new_content.find('>', all_start) + 1
-    all_end = new_content.find('</ul>', all_start)
-    new_content = (
-        new_content[:all_start] +
-        '\n' + '\n'.join(all_posts) + '\n' +
-        new_content[all_end:]
-    )
-
-# Check if JavaScript is already present in the content
-js_start_marker = 'let selectedTags = [];'
-if js_start_marker not in new_content:
-    # JavaScript for filtering
-    new_content += """
-<script>
-let selectedTags = [];
-
-function toggleTag(tagEl) {
-  const tagName = tagEl.dataset.tag;
-  const index = selectedTags.indexOf(tagName);
-  if (index > -1) {
-    selectedTags.splice(index, 1);
-    tagEl.classList.remove('selected');
-  } else {
-    selectedTags.push(tagName);
-    tagEl.classList.add('selected');
-  }
-  filterPosts();
-}
-
-function filterPosts() {
-  const searchQuery = document.getElementById('weblog-search').value.toLowerCase();
-  const allLis = document.getElementById('all-weblogs').getElementsByTagName('li');
-  
-  let anyFilterActive = searchQuery !== '' || selectedTags.length > 0;
-
-  if (anyFilterActive) {
-    document.getElementById('most-recent-heading').style.display = 'none';
-    document.getElementById('weblog-list').style.display = 'none';
-    document.getElementById('all-logs-heading').style.display = 'block';
-    document.getElementById('all-weblogs').style.display = 'block';
-    document.getElementById('all-weblogs').style.maxHeight = '400px';
-    document.getElementById('all-weblogs').style.overflowY = 'auto';
-
-    for (let i = 0; i < allLis.length; i++) {
-      const li = allLis[i];
-      const postText = (li.textContent || li.innerText).toLowerCase();
-      const postTags = (li.dataset.tags || '').split(',');
-
-      const searchMatch = postText.includes(searchQuery);
-      const tagMatch = selectedTags.length === 0 || selectedTags.every(tag => postTags.includes(tag));
-      
-      if (searchMatch && tagMatch) {
-        li.style.display = '';
-      } else {
-        li.style.display = 'none';
-      }
-    }
-  } else {
-    showDefaultView();
-  }
-}
-
-function showDefaultView() {
-    document.getElementById('most-recent-heading').innerText = "Most Recent";
-    document.getElementById('most-recent-heading').style.display = 'block';
-    document.getElementById('weblog-list').style.display = 'block';
-    document.getElementById('weblog-list').style.maxHeight = '';
-    document.getElementById('weblog-list').style.overflowY = '';
-    document.getElementById('all-logs-heading').style.display = 'none';
-    document.getElementById('all-weblogs').style.display = 'none';
-
-    const allLis = document.getElementById('all-weblogs').getElementsByTagName('li');
-    for (let i = 0; i < allLis.length; i++) {
-        allLis[i].style.display = "";
-    }
-
-    const ul = document.getElementById('weblog-list');
-    ul.innerHTML = '';
-    for (let i = 0; i < 10 && i < allLis.length; i++) {
-      ul.appendChild(allLis[i].cloneNode(true));
-    }
-}
-
-function handleSearchInput(input) {
-  filterPosts();
-}
-
-function showAllLogs() {
-  document.getElementById('most-recent-heading').style.display = 'none';
-  document.getElementById('weblog-list').style.display = 'none';
-  document.getElementById('all-logs-heading').style.display = 'block';
-  document.getElementById('all-weblogs').style.display = 'block';
-  const weblogList = document.getElementById('all-weblogs');
-  weblogList.style.maxHeight = '400px';
-  weblogList.style.overflowY = 'auto';
-}
-
-// Initial setup
-document.addEventListener('DOMContentLoaded', () => {
-    showDefaultView();
-});
-</script>"""
-
-# Write the updated content back to the file
-with open(INDEX_FILE, 'w', encoding="utf-8") as f:
-    f.write(new_content)
-
-print("Weblog index updated successfully!")
+    return html_body, {'markdown': rendered - start, 'code_blocks': time.perf_counter() - rendered}
+
+def render_posts(posts, jobs=1, cache_args=(False,)):
+    """Render post bodies, spreading the work over `jobs` processes.
+
+    Results are collected in input order, so the pages written afterwards
+    are the same as a serial run.
+    """
+    sources = [p.load_markdown() for p in posts]
+    if jobs > 1 and len(posts) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(posts)),
+                                 initializer=init_render_cache, initargs=cache_args) as pool:
+            bodies = list(pool.map(render_post_body, sources))
+    else:
+        bodies = [render_post_body(body) for body in sources]
+    for post, (html_body, timings) in zip(posts, bodies):
+        post.body = html_body
+        profiling.record_post(post.slug, timings)
+
+def related_html(related_posts):
+    if not related_posts:
+        return ''
+    items = ''.join(f'\n        <li><a href="../{p.slug}/">{p.title}</a> <span class="weblog-date">{p.date_str}</span></li>'
+                    for p in related_posts)
+    return f"""
+    <div class="weblog-related">
+      <h2>Related posts</h2>
+      <ul class="weblog-list">{items}
+      </ul>
+    </div>"""
+
+def series_html(series):
+    if not series:
+        return ''
+    name, part, prev_part, next_part = series
+    links = [f'<a href="../../series/{series_slug(name)}/">{name}</a>, part {part}']
+    if prev_part:
+        links.append(f'<a href="../{prev_part.slug}/" rel="prev">← {prev_part.title}</a>')
+    if next_part:
+        links.append(f'<a href="../{next_part.slug}/" rel="next">{next_part.title} →</a>')
+    return f"""
+    <nav class="weblog-series">{' · '.join(links)}</nav>"""
+
+def post_nav_html(older, newer):
+    if not (older or newer):
+        return ''
+    links = []
+    links.append(f'<a href="../{older.slug}/" rel="prev">← {older.title}</a>' if older else '<span></span>')
+    if newer:
+        links.append(f'<a href="../{newer.slug}/" rel="next">{newer.title} →</a>')
+    return f"""
+    <nav class="weblog-pager">{' '.join(links)}</nav>"""
+
+def write_post_page(post, assets, related_posts=(), nav=None):
+    """Write one post page, linking only the assets its body uses.
+
+    `nav` is the PostIndex the previous/next and series links come from.
+    """
+    older, newer = nav.neighbors(post) if nav else (None, None)
+    series = nav.series(post) if nav else None
+    return render_page('post.html', post.output_path, {
+        'root': '../../',
+        'asset_tags': [f"\n  {tag}" for tag in assets.tags(page_asset_groups(post.body), '../../../')],
+        'title': post.title,
+        'series': series_html(series),
+        'date': post.date_str,
+        'tags': [f'<a href="../../tags/{tag_slug(tag)}.html" class="weblog-tag">{tag}</a>' for tag in post.tags],
+        'body': post.body,
+        'related': related_html(related_posts),
+        'nav': post_nav_html(older, newer),
+    }, post.slug)
+
+def listing_items(posts, root):
+    for post in posts:
+        yield f'<li><a href="{root}posts/{post.slug}/">{post.title}</a> <span class="weblog-date">{post.date_str}</span></li>\n'
+
+def write_listing_page(path, title, heading, root, posts_desc, pager=''):
+    """Write a tag or archive page listing `posts_desc`; `root` is the relative path to weblog/."""
+    return render_page('listing.html', path, {
+        'root': root, 'asset_tags': '', 'title': title, 'heading': heading,
+        'items': listing_items(posts_desc, root), 'pager': pager,
+    })
+
+def write_series_page(name, members, manifest, incremental):
+    """Write the table of contents of one collection; return 1 if it was rewritten."""
+    path = series_path(name)
+    signature = hash_json([name, [(p.slug, p.title, p.date_str) for p in members], page_signature()])
+    if incremental and manifest.is_fresh(path, signature, path):
+        return 0
+    written = render_page('series.html', path, {
+        'root': '../../', 'asset_tags': '', 'title': f"Weblog: {name}", 'heading': name,
+        'count': str(len(members)), 'items': listing_items(members, '../../'),
+    })
+    manifest.record_page(path, signature)
+    return written
+
+# --- Pagination ---
+
+def pager_html(newer_href, label, older_href):
+    links = []
+    if newer_href:
+        links.append(f'<a href="{newer_href}" rel="prev">← Newer</a>')
+    if label:
+        links.append(f'<span class="weblog-page">{label}</span>')
+    if older_href:
+        links.append(f'<a href="{older_href}" rel="next">Older →</a>')
+    return f'<nav class="weblog-pager">{" ".join(links)}</nav>\n'
+
+def write_archive_pages(posts, base_dir, root, landing_href, title, heading, size, manifest, incremental):
+    """Write base_dir/page/<k>/index.html for every page of `posts` (oldest first).
+
+    Nothing is written when everything fits on the landing page. Pages
+    whose membership and links are unchanged are skipped, and pages past
+    the last one are removed. Returns the number of pages written.
+    """
+    pages = archive_pages(posts, size)
+    written = 0
+    for k, page in pages:
+        path = os.path.join(base_dir, 'page', str(k), 'index.html')
+        is_newest = k == len(pages)
+        signature = hash_json([[(p.slug, p.title, p.date_str) for p in page], k, is_newest, page_signature()])
+        if incremental and manifest.is_fresh(path, signature, path):
+            continue
+        pager = pager_html(landing_href if is_newest else f"../{k + 1}/",
+                           f"page {k}",
+                           f"../{k - 1}/" if k > 1 else None)
+        written += write_listing_page(path, f"{title} (page {k})", heading, root, list(reversed(page)), pager)
+        manifest.record_page(path, signature)
+
+    # Drop pages left over from when there were more posts
+    page_root = os.path.join(base_dir, 'page')
+    if os.path.isdir(page_root):
+        for name in os.listdir(page_root):
+            if name.isdigit() and int(name) > len(pages):
+                shutil.rmtree(os.path.join(page_root, name))
+        if not os.listdir(page_root):
+            os.rmdir(page_root)
+    return written
+
+def prune_tag_pages(tags):
+    """Remove the pages (and archive pages) of tags no post uses any more."""
+    keep = {tag_slug(tag) for tag in tags}
+    for name in os.listdir(TAGS_DIR):
+        path = os.path.join(TAGS_DIR, name)
+        if name.endswith('.html') and name[:-len('.html')] not in keep:
+            os.remove(path)
+        elif os.path.isdir(path) and name not in keep:
+            shutil.rmtree(path)
+
+def update_index(posts, tags_dict, manifest, incremental, page_size=PAGE_SIZE):
+    """Fill the tag cloud, the recent list and the search script regions of weblog/index.html.
+
+    Each region is only replaced when its inputs changed; returns the
+    number of regions rewritten.
+    """
+    # Generate main index.html (recent weblogs: newest first)
+    posts_desc = sorted(posts, key=lambda p: p.date, reverse=True)
+
+    # Generate new tags content
+    new_tags = []
+    for tag, tag_posts in sorted(tags_dict.items()):
+        new_tags.append(f'<button class="weblog-tag" data-tag="{tag}" onclick="toggleTag(this)">{tag} ({len(tag_posts)})</button>')
+
+    # Generate recent posts
+    recent_posts = []
+    for post in posts_desc[:page_size]:
+        url = f"posts/{post.slug}/"
+        tags_str = ','.join(post.tags)
+        recent_posts.append(f'<li data-tags="{tags_str}"><a href="{url}">{post.title}</a> <span class="weblog-date">{post.date_str}</span></li>')
+    older = older_page_number(len(posts), page_size)
+    if older:
+        recent_posts.append(f'<li class="weblog-more"><a href="page/{older}/">Older posts →</a></li>')
+
+    # The full post list is no longer inlined: search results and "All" are
+    # rendered from the lazily fetched search index (see search_index.py)
+    script = templates.get('index-script.html').render_string({})
+    if page_optimizer:
+        script = page_optimizer.minify_fragment(f"{INDEX_FILE}#script", script)
+    sections = {'tags': new_tags, 'recent': recent_posts, 'script': [script]}
+    signatures = {name: hash_json(lines) for name, lines in sections.items()}
+    changed = {name for name, sig in signatures.items()
+               if not (incremental and manifest.is_fresh(f"{INDEX_FILE}#{name}", sig))}
+    if not changed:
+        return 0
+
+    # The page itself is hand-maintained; only its marked regions are generated
+    with open(INDEX_FILE, 'r', encoding="utf-8") as f:
+        page, regions = templates.parse_regions(f.read(), INDEX_FILE)
+    missing = set(sections) - set(regions)
+    if missing:
+        raise SystemExit(f"{INDEX_FILE} has no <!-- region:{sorted(missing)[0]} --> placeholder")
+    for name in changed:
+        regions[name] = '\n' + '\n'.join(sections[name]) + '\n'
+    page.render_to(INDEX_FILE, regions)
+
+    for name in changed:
+        manifest.record_page(f"{INDEX_FILE}#{name}", signatures[name])
+    return len(changed)
+
+def open_manifest(path=MANIFEST_FILE):
+    return Manifest(path, generator_fingerprint(markdown.__version__))
+
+def build(posts, manifest, incremental=False, jobs=1, use_cache=True, cache_path=CACHE_FILE,
+          page_size=PAGE_SIZE, assets=None, fetch_images=True, minify=True, critical_css=False,
+          minify_report=False):
+    """Write post pages, tag pages and the index for already loaded posts.
+
+    `assets` is an AssetPipeline to reuse (the dev server keeps one);
+    by default the assets are published afresh. Remote images are only
+    downloaded (to make resized copies) with `fetch_images`. With `minify`
+    pages are minified, and with `critical_css` they also inline their
+    critical CSS (see minify.py);
+    `minify_report` prints their before/after sizes.
+    """
+    global page_optimizer, stylesheet_url
+    os.makedirs(TAGS_DIR, exist_ok=True)
+    init_render_cache(use_cache, cache_path)
+    page_optimizer = PageOptimizer(STYLE_FILE, critical_css) if minify else None
+
+    tags_dict = defaultdict(list)
+    for post in posts:
+        for tag in post.tags:
+            tags_dict[tag].append(post)
+    check_tag_slugs(tags_dict)
+
+    # Sort posts by date ascending for navigation (oldest to newest)
+    nav = PostIndex(posts)
+    posts = nav.posts
+
+    # Publish fingerprinted scripts and styles; a post page depends on
+    # its source and on the asset URLs it may link
+    if assets is None:
+        with profiling.stage('assets'):
+            assets = AssetPipeline()
+    stylesheet_url = assets.urls['weblog-style.css']
+
+    # Related posts (shared tags + body similarity) are part of each page
+    with profiling.stage('related'):
+        related, cooccurrence = compute_related(posts, render_cache)
+    by_slug = {p.slug: p for p in posts}
+    related_posts = {slug: [by_slug[other] for other, _ in items] for slug, items in related.items()}
+
+    # Render the posts whose pages are stale, then write them in order
+    images = ImagePipeline(fetch=fetch_images)
+
+    def post_signature(p, image_record):
+        return hash_json([p.hash, p.date_str, assets.signature, images.signature, page_signature(),
+                          images.sources_signature(image_record),
+                          [(r.slug, r.title, r.date_str) for r in related_posts[p.slug]],
+                          nav.page_links(p)])
+
+    signatures = {p.source: post_signature(p, manifest.images.get(p.output_path)) for p in posts}
+    stale = [p for p in posts
+             if not (incremental and manifest.is_fresh(p.output_path, signatures[p.source], p.output_path))]
+    with profiling.stage('render'):
+        render_posts(stale, jobs, (use_cache, cache_path))
+
+    # Resized copies of the images the rendered posts use, then srcset/lazy loading
+    with profiling.stage('images'):
+        page_dirs = {p.slug: os.path.dirname(p.output_path) for p in stale}
+        infos = images.process([(page_dirs[p.slug], p.body) for p in stale], jobs)
+        for post in stale:
+            post.body = images.rewrite(post.body, page_dirs[post.slug], infos, '../../../')
+    if images.failed:
+        print(f"Could not fetch {len(images.failed)} remote images; they are linked at full size")
+
+    # Generate individual post pages
+    posts_written = 0
+    with profiling.stage('posts'):
+        for post in stale:
+            posts_written += write_post_page(post, assets, related_posts[post.slug], nav)
+            # Signed with the originals the page was just built from
+            record = images.pages.get(page_dirs[post.slug], {'sources': {}, 'derivatives': []})
+            manifest.record_images(post.output_path, record)
+            manifest.record_page(post.output_path, post_signature(post, record))
+    with profiling.stage('images'):
+        images.prune(manifest.forget_images(p.output_path for p in posts))
+
+    # Generate tag pages: tags/<slug>.html lists the newest posts, older
+    # ones are paged under tags/<slug>/page/<k>/
+    tags_written = 0
+    with profiling.stage('tags'):
+        for tag, tag_posts in tags_dict.items():
+            slug = tag_slug(tag)
+            tag_posts = sorted(tag_posts, key=lambda p: p.date)
+            tag_posts_sorted = tag_posts[::-1][:page_size]
+            older = older_page_number(len(tag_posts), page_size)
+            pager = pager_html(None, None, f"{slug}/page/{older}/") if older else ''
+            output = f"{TAGS_DIR}/{slug}.html"
+            signature = hash_json([[(p.slug, p.title, p.date_str) for p in tag_posts_sorted], older, page_signature()])
+            if not (incremental and manifest.is_fresh(output, signature, output)):
+                tags_written += write_listing_page(output, f"Weblog: {tag}", f"#{tag}", '../',
+                                                   tag_posts_sorted, pager)
+                manifest.record_page(output, signature)
+            tags_written += write_archive_pages(tag_posts, os.path.join(TAGS_DIR, slug), '../../../../',
+                                                f"../../../{slug}.html", f"Weblog: {tag}", f"#{tag}",
+                                                page_size, manifest, incremental)
+        prune_tag_pages(tags_dict)
+
+    # Table of contents of every collection
+    series_written = 0
+    with profiling.stage('series'):
+        for name, members in nav.collections.items():
+            series_written += write_series_page(name, members, manifest, incremental)
+        prune_series(nav.collections)
+
+    with profiling.stage('index'):
+        sections_written = update_index(posts, tags_dict, manifest, incremental, page_size)
+    with profiling.stage('archive'):
+        archive_written = write_archive_pages(posts, WEBLOG_DIR, '../../', '../../', "Weblog", "All logs",
+                                              page_size, manifest, incremental)
+    with profiling.stage('search'):
+        search_files = build_search_index(posts, render_cache)
+    with profiling.stage('related'):
+        write_related_graph(posts, related, cooccurrence)
+    with profiling.stage('cache'):
+        render_cache.evict()
+        render_cache.close()
+
+    print(f"Posts: {len(stale)}/{len(posts)} rebuilt, {posts_written} written, tag pages: {tags_written} written, "
+          f"series pages: {series_written} written, archive pages: {archive_written} written, index sections: {sections_written}/3 updated, "
+          f"search index files: {search_files} written, assets: {assets.written} published, "
+          f"image derivatives: {images.written} written, {images.removed} removed")
+    if page_optimizer:
+        print(page_optimizer.summary())
+        if minify_report and page_optimizer.pages:
+            print(page_optimizer.report())
+    print("Weblog index updated successfully!")
+
+def add_arguments(parser):
+    parser.add_argument('--incremental', action='store_true',
+                        help="only rebuild pages whose inputs changed since the last run (see --manifest)")
+    parser.add_argument('--manifest', default=MANIFEST_FILE,
+                        help=f"build manifest location (default: {MANIFEST_FILE})")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="worker processes for Markdown rendering (default: number of CPUs, 1 = serial)")
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE,
+                        help=f"posts per index, tag and archive page (default: {PAGE_SIZE})")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="render every post from scratch without reading or filling the render cache")
+    parser.add_argument('--cache', default=CACHE_FILE,
+                        help=f"render cache location (default: {CACHE_FILE})")
+    parser.add_argument('--no-fetch-images', action='store_true',
+                        help="don't download remote images to make resized copies of them")
+    parser.add_argument('--no-minify', action='store_true',
+                        help="write pages unminified (and without critical CSS)")
+    parser.add_argument('--critical-css', action='store_true',
+                        help="inline each page's critical CSS and load the rest of the stylesheet asynchronously")
+    parser.add_argument('--minify-report', action='store_true',
+                        help="print the size of every page rendered before and after minification")
+    profiling.add_arguments(parser)
+
+def build_from_args(posts, manifest, args):
+    build(posts, manifest, incremental=args.incremental, jobs=max(1, args.jobs),
+          use_cache=not args.no_cache, cache_path=args.cache, page_size=max(1, args.page_size),
+          fetch_images=not args.no_fetch_images, minify=not args.no_minify, critical_css=args.critical_css,
+          minify_report=args.minify_report)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate weblog post, tag and index pages from weblog/posts/*.md")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    with profiling.session(args):
+        manifest = open_manifest(args.manifest)
+        with profiling.stage('load'):
+            posts = load_posts(manifest, args.incremental)
+        build_from_args(posts, manifest, args)
+        manifest.save()
+    print(output_stats.summary())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""First and last commit time of every file, from a single `git log` pass.
+
+File mtimes are reset by every checkout, so they can't date anything the
+site publishes. Instead one `git log --name-only` over the history gives,
+per path, the time of the commit that added it (published) and of the
+latest commit that touched it (updated).
+
+The result is cached in .build/git-dates.json together with the commit
+it describes. When HEAD has moved on from that commit only the new
+commits are read; after a rebase or a switch to an unrelated branch the
+history is read again from scratch. Outside a git checkout (or without
+git) the index is empty and callers fall back to their own dates.
+
+CI must fetch the full history (fetch-depth: 0): in a shallow clone every
+file would look as if it had been added by the oldest fetched commit.
+"""
+import os
+import json
+import subprocess
+from datetime import datetime, timezone
+
+GIT_DATES_FILE = '.build/git-dates.json'
+LOG_FORMAT = '%x00%ct'
+
+
+def _git(*args):
+    """stdout of a git command run in the current directory, or None if it failed."""
+    try:
+        result = subprocess.run(['git', '-c', 'core.quotePath=false', *args],
+                                capture_output=True, text=True, encoding='utf-8')
+    except OSError:
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def read_log(files, revisions):
+    """Add the commits in `revisions` to `files` ({path: [first, last]}); newest commit first."""
+    # --relative: paths relative to (and limited to) the current directory
+    out = _git('log', f'--format={LOG_FORMAT}', '--name-only', '--no-renames', '--relative', revisions)
+    if out is None:
+        return False
+    for commit in out.split('\0')[1:]:
+        lines = commit.split('\n')
+        timestamp = int(lines[0])
+        for path in lines[1:]:
+            if not path:
+                continue
+            entry = files.get(path)
+            if entry is None:
+                files[path] = [timestamp, timestamp]
+            else:
+                # Older commits come later: they move `first` back, never `last`
+                entry[0] = min(entry[0], timestamp)
+                entry[1] = max(entry[1], timestamp)
+    return True
+
+
+class GitDates:
+    """Publish and update times of committed files, as UTC datetimes."""
+
+    def __init__(self, files=None, head=None):
+        self.files = files or {}
+        self.head = head
+
+    def _time(self, path, i):
+        entry = self.files.get(os.path.normpath(path))
+        return datetime.fromtimestamp(entry[i], tz=timezone.utc) if entry else None
+
+    def first(self, path):
+        """Time of the commit that added `path`, or None if it was never committed."""
+        return self._time(path, 0)
+
+    def last(self, path):
+        """Time of the latest commit that changed `path`, or None."""
+        return self._time(path, 1)
+
+
+def load(cache_path=GIT_DATES_FILE):
+    """Return the GitDates of the current checkout, updating the cache if HEAD moved."""
+    head = (_git('rev-parse', 'HEAD') or '').strip()
+    if not head:
+        return GitDates()
+    cached = {}
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
+    files = cached.get('files', {})
+    old = cached.get('head')
+    if old == head:
+        return GitDates(files, head)
+
+    if old and _git('merge-base', '--is-ancestor', old, head) is not None:
+        ok = read_log(files, f'{old}..{head}')
+    else:
+        files = {}
+        ok = read_log(files, head)
+    if not ok:
+        return GitDates()
+    if (_git('rev-parse', '--is-shallow-repository') or '').strip() == 'true':
+        print("Warning: shallow clone, publish dates of old files are the oldest fetched commit's")
+
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    tmp = cache_path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'head': head, 'files': files}, f, sort_keys=True, separators=(',', ':'))
+    os.replace(tmp, cache_path)
+    return GitDates(files, head)
+
+
+_dates = None
+
+
+def dates():
+    """The GitDates of this process, loaded on first use."""
+    global _dates
+    if _dates is None:
+        _dates = load()
+    return _dates
@@ -0,0 +1,374 @@
+"""Responsive images for rendered posts.
+
+Every <img> in a rendered post body is resolved to its original file: a
+path in the site, or for a remote URL a copy downloaded once into
+.build/images/ (named by the URL's hash). From the original's bytes the
+pipeline derives resized copies at WIDTHS narrower than the image, in
+AVIF and WebP where Pillow can write them and in the original format as
+the fallback. They are published as assets/img/<content hash>-<width>.<ext>,
+so an image that didn't change is never processed again and a changed one
+gets new URLs. Missing derivatives of a build are made in a process pool.
+For each page the pipeline records the content hashes of its originals
+and the derivatives it links: the hashes go into the page's signature, so
+replacing an image file rebuilds the pages that show it, and derivatives
+no page links any more are removed.
+
+The tag is then rewritten: width/height from the image header, lazy
+loading and async decoding, a srcset of the derivatives, and for the
+modern formats a <picture> with one <source> per format. Without Pillow
+(an optional dependency) no derivatives are made and images only get
+the attributes; SVGs and GIFs (which may be animated) are never resized.
+"""
+import os
+import re
+import html
+import struct
+import hashlib
+import posixpath
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import unquote, urlsplit
+
+from build_manifest import hash_json
+import profiling
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IMAGES_DIR = 'assets/img'
+ORIGINALS_DIR = '.build/images'
+WIDTHS = (480, 960, 1440)
+SIZES = '(max-width: 800px) 100vw, 800px'
+QUALITY = {'avif': 50, 'webp': 80, 'jpeg': 82}
+FETCH_TIMEOUT = 10
+FETCH_THREADS = 8
+
+IMG_RE = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+ATTR_RE = re.compile(r'([^\s"\'>/=]+)(?:\s*=\s*("[^"]*"|\'[^\']*\'|[^\s"\'>]+))?')
+
+MIME = {'avif': 'image/avif', 'webp': 'image/webp'}
+# Extensions of originals that get resized copies, by Pillow format name
+RESIZABLE = {'.jpg': 'jpeg', '.jpeg': 'jpeg', '.png': 'png', '.webp': 'webp'}
+
+
+def modern_formats():
+    """Formats derivatives are made in besides the original's, best first."""
+    if Image is None:
+        return ()
+    Image.init()
+    extensions = Image.registered_extensions()
+    return tuple(fmt for fmt in ('avif', 'webp') if extensions.get(f'.{fmt}') in Image.SAVE)
+
+
+# --- Image headers ---
+
+def image_size(data):
+    """(width, height) from a PNG, GIF, JPEG or WebP header, or None."""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        return struct.unpack('<HH', data[6:10])
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP' and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b'VP8 ':
+            w, h = struct.unpack('<HH', data[26:30])
+            return w & 0x3fff, h & 0x3fff
+        if chunk == b'VP8L':
+            bits = int.from_bytes(data[21:25], 'little')
+            return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+        if chunk == b'VP8X':
+            return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+        return None
+    if data[:2] == b'\xff\xd8':
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xff:
+                return None
+            marker = data[i + 1]
+            length = struct.unpack('>H', data[i + 2:i + 4])[0]
+            # Start-of-frame markers, except DHT, JPG and DAC
+            if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+                h, w = struct.unpack('>HH', data[i + 5:i + 9])
+                return w, h
+            i += 2 + length
+    return None
+
+
+# --- Originals ---
+
+def original_path(url):
+    """Where the downloaded copy of a remote image is kept."""
+    ext = posixpath.splitext(urlsplit(url).path)[1].lower()
+    return os.path.join(ORIGINALS_DIR, hashlib.sha256(url.encode('utf-8')).hexdigest()[:32] + ext)
+
+
+def local_path(src, page_dir):
+    """The file a site-relative or site-absolute `src` refers to, or None."""
+    path = unquote(urlsplit(src).path)
+    if path.startswith('/'):
+        path = path.lstrip('/')
+    else:
+        path = os.path.join(page_dir, path)
+    path = os.path.normpath(path)
+    return path if not path.startswith('..') and os.path.isfile(path) else None
+
+
+def _download(url):
+    path = original_path(url)
+    try:
+        with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT) as response:
+            data = response.read()
+    except OSError:
+        return False
+    os.makedirs(ORIGINALS_DIR, exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
+
+
+def fetch_originals(urls):
+    """Download the remote images not fetched yet; return the URLs that failed."""
+    missing = sorted(url for url in urls if not os.path.exists(original_path(url)))
+    if not missing:
+        return []
+    with ThreadPoolExecutor(max_workers=min(FETCH_THREADS, len(missing))) as pool:
+        return [url for url, ok in zip(missing, pool.map(_download, missing)) if not ok]
+
+
+def file_state(path, known=None):
+    """[mtime_ns, size, sha256] of the file at `path`, or None if there is none.
+
+    `known` is an earlier state of the file; if its mtime and size still
+    match, its hash is reused rather than the file read again.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if known and list(known[:2]) == [st.st_mtime_ns, st.st_size]:
+        return known
+    with open(path, 'rb') as f:
+        return [st.st_mtime_ns, st.st_size, hashlib.sha256(f.read()).hexdigest()]
+
+
+# --- Derivatives ---
+
+def derivative_name(digest, width, fmt):
+    return f"{digest[:16]}-{width}.{'jpg' if fmt == 'jpeg' else fmt}"
+
+
+def make_derivatives(source, jobs):
+    """Write the resized copies `jobs` ([(path, width, format)]) of one original.
+
+    Runs in worker processes; returns the number of files written.
+    """
+    with Image.open(source) as im:
+        im.load()
+        if im.mode not in ('RGB', 'RGBA'):
+            im = im.convert('RGBA' if 'transparency' in im.info or im.mode in ('LA', 'PA') else 'RGB')
+        for path, width, fmt in jobs:
+            height = max(1, round(im.height * width / im.width))
+            resized = im.resize((width, height), Image.LANCZOS)
+            if fmt == 'jpeg' and resized.mode != 'RGB':
+                resized = resized.convert('RGB')
+            options = {'optimize': True} if fmt == 'png' else {'quality': QUALITY[fmt]}
+            tmp = f"{path}.tmp"
+            resized.save(tmp, format=fmt.upper(), **options)
+            os.replace(tmp, path)
+    return len(jobs)
+
+
+class ImageInfo:
+    """What the rewritten tag needs to know about one original."""
+
+    def __init__(self, width=None, height=None, variants=None, state=None):
+        self.width = width
+        self.height = height
+        # format -> [(width, path under IMAGES_DIR)], narrowest first
+        self.variants = variants or {}
+        # file_state() of the original
+        self.state = state
+
+
+class ImagePipeline:
+    """Resolves, measures and derives the images of rendered post bodies."""
+
+    def __init__(self, fetch=True, out_dir=IMAGES_DIR):
+        self.fetch = fetch
+        self.out_dir = out_dir
+        self.formats = modern_formats()
+        self.written = 0
+        self.removed = 0
+        self.failed = []
+        # page dir -> {'sources': {original: file_state()}, 'derivatives': [name]}
+        self.pages = {}
+
+    @property
+    def signature(self):
+        """Changes with anything that changes rewritten tags for the same images."""
+        return hash_json([WIDTHS, SIZES, self.formats, Image is not None])
+
+    def sources_signature(self, record):
+        """[(original, content hash)] now, for the originals of a page's last `record`.
+
+        The record's file states are refreshed in place, so an original
+        that was only touched is not hashed again on the next build.
+        """
+        if not record:
+            return []
+        sources = record['sources']
+        for path, known in sources.items():
+            sources[path] = file_state(path, known)
+        return sorted((path, state and state[2]) for path, state in sources.items())
+
+    def _plan(self, path):
+        """Measure an original; return (ImageInfo, derivative jobs still to do)."""
+        with open(path, 'rb') as f:
+            data = f.read()
+        st = os.stat(path)
+        digest = hashlib.sha256(data).hexdigest()
+        state = [st.st_mtime_ns, st.st_size, digest]
+        size = image_size(data)
+        if size is None:
+            return ImageInfo(state=state), []
+        info = ImageInfo(*size, state=state)
+        fallback = RESIZABLE.get(os.path.splitext(path)[1].lower())
+        if Image is None or fallback is None:
+            return info, []
+        jobs = []
+        for fmt in self.formats + ((fallback,) if fallback not in self.formats else ()):
+            widths = [w for w in WIDTHS if w < info.width]
+            # Modern formats also get a full-width copy; the original is the fallback's
+            if fmt != fallback:
+                widths.append(info.width)
+            for width in widths:
+                name = derivative_name(digest, width, fmt)
+                info.variants.setdefault(fmt, []).append((width, name))
+                out = os.path.join(self.out_dir, name)
+                if not os.path.exists(out):
+                    jobs.append((out, width, fmt))
+        return info, jobs
+
+    def process(self, bodies_by_dir, jobs=1):
+        """Measure and derive every image in the bodies; return {(page dir, src): ImageInfo}.
+
+        `bodies_by_dir` is [(page dir, html)]; relative srcs are resolved
+        against the page's directory.
+        """
+        originals = {}
+        remote = set()
+        for page_dir, body in bodies_by_dir:
+            for tag in IMG_RE.findall(body):
+                src = html.unescape(dict(_attrs(tag)).get('src') or '')
+                if not src or src.startswith('data:'):
+                    continue
+                if urlsplit(src).scheme in ('http', 'https'):
+                    originals[(page_dir, src)] = original_path(src)
+                    remote.add(src)
+                else:
+                    originals[(page_dir, src)] = local_path(src, page_dir)
+        if self.fetch:
+            self.failed = fetch_originals(remote)
+
+        infos = {}
+        work = {}
+        for key, path in originals.items():
+            if not path:
+                continue
+            record = self.pages.setdefault(key[0], {'sources': {}, 'derivatives': []})
+            # A remote image that couldn't be fetched is recorded as missing,
+            # so its pages are rebuilt once it has been
+            record['sources'][path] = None
+            if not os.path.exists(path):
+                continue
+            infos[key], todo = self._plan(path)
+            record['sources'][path] = infos[key].state
+            record['derivatives'] += [name for variants in infos[key].variants.values() for _, name in variants]
+            if todo:
+                work[path] = todo
+
+        if work:
+            os.makedirs(self.out_dir, exist_ok=True)
+            if jobs > 1 and len(work) > 1:
+                with ProcessPoolExecutor(max_workers=min(jobs, len(work))) as pool:
+                    self.written += sum(pool.map(make_derivatives, list(work), list(work.values())))
+            else:
+                self.written += sum(make_derivatives(path, todo) for path, todo in work.items())
+            # Written in worker processes, which can't report to the profile
+            for todo in work.values():
+                for out, _, _ in todo:
+                    profiling.record_output(out)
+        return infos
+
+    def prune(self, records):
+        """Remove the derivatives in out_dir that none of the page `records` links."""
+        keep = {name for record in records for name in record['derivatives']}
+        if not os.path.isdir(self.out_dir):
+            return
+        for name in os.listdir(self.out_dir):
+            path = os.path.join(self.out_dir, name)
+            if name not in keep and os.path.isfile(path):
+                os.remove(path)
+                self.removed += 1
+
+    def rewrite(self, body, page_dir, infos, site_root):
+        """`body` with every <img> made responsive; `site_root` is the relative path to the site root."""
+        def replace(match):
+            tag = match.group(0)
+            attrs = _attrs(tag)
+            names = {name.lower() for name, _ in attrs}
+            src = html.unescape(dict(attrs).get('src') or '')
+            info = infos.get((page_dir, src), ImageInfo())
+            extra = []
+            if 'loading' not in names:
+                extra.append(('loading', 'lazy'))
+            if 'decoding' not in names:
+                extra.append(('decoding', 'async'))
+            if info.width and 'width' not in names and 'height' not in names:
+                extra += [('width', str(info.width)), ('height', str(info.height))]
+            fallback = [fmt for fmt in info.variants if fmt not in MIME]
+            if fallback and 'srcset' not in names:
+                extra.append(('srcset', self._srcset(info.variants[fallback[0]], site_root, (src, info.width))))
+                extra.append(('sizes', SIZES))
+            img = _render_img(attrs + extra, tag)
+            sources = [f'<source type="{MIME[fmt]}" srcset="{self._srcset(info.variants[fmt], site_root)}" '
+                       f'sizes="{SIZES}">' for fmt in self.formats if fmt in info.variants]
+            if not sources or 'srcset' in names:
+                return img
+            return f"<picture>{''.join(sources)}{img}</picture>"
+
+        return IMG_RE.sub(replace, body)
+
+    def _srcset(self, variants, site_root, original=None):
+        candidates = [(site_root + posixpath.join(self.out_dir, name), width) for width, name in variants]
+        # A URL with a space or comma can't be a srcset candidate
+        if original and original[1] and not re.search(r'[\s,]', original[0]):
+            candidates.append(original)
+        return html.escape(', '.join(f"{url} {width}w" for url, width in candidates))
+
+
+def _attrs(tag):
+    """[(name, value or None)] of an <img> tag, values unquoted but not unescaped."""
+    inner = tag[4:].rstrip('>').rstrip('/')
+    attrs = []
+    for name, raw in ATTR_RE.findall(inner):
+        if not raw:
+            attrs.append((name, None))
+        elif raw[0] == "'":
+            # Re-rendered in double quotes
+            attrs.append((name, raw[1:-1].replace('"', '&quot;')))
+        else:
+            attrs.append((name, raw[1:-1] if raw[0] == '"' else raw))
+    return attrs
+
+
+def _render_img(attrs, original):
+    parts = []
+    for name, value in attrs:
+        parts.append(name if value is None else f'{name}="{value}"')
+    end = ' />' if original.rstrip('>').endswith('/') else '>'
+    return f"<img {' '.join(parts)}{end}"
@@ -0,0 +1,215 @@
+"""Offline check of the internal links in the built site.
+
+Every file of the site is indexed once: its path, and for HTML files the
+ids (and names) it defines. The generated pages and feeds are then
+scanned for references: href, src and srcset in HTML, <link>/<loc> and
+Atom link hrefs in the XML feeds and the sitemap, and the URLs in
+feed.json. Each reference to this site (relative, root-relative or
+starting with SITE_URL) must name an existing file, or a directory with
+an index.html, and its #fragment must be an id of the target page.
+External URLs are not fetched, so the check runs offline.
+
+Reading and scanning the files is the expensive part and is spread over
+a process pool; resolving a reference is then a couple of set lookups.
+Precompressed .gz/.br siblings are neither indexed nor scanned.
+
+    python scripts/linkcheck.py [-j N]
+
+exits with status 1 if any reference is broken.
+"""
+import os
+import re
+import glob
+import html
+import json
+import argparse
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import unquote, urlsplit
+
+from content import SITE_URL
+import profiling
+
+# Outputs whose references are checked
+PATTERNS = [
+    'weblog/**/*.html',
+    'rss.xml', 'atom.xml', 'feed.json', 'sitemap.xml', 'feeds/**/*.xml',
+]
+SKIP_DIRS = {'.git', '.build', '.github', 'scripts', 'node_modules'}
+SKIP_SUFFIXES = ('.gz', '.br')
+MAX_REPORTED = 50
+
+# The generated markup is lower case; case-insensitive matching would double the scan time
+TAG_RE = re.compile(r'<(?:a|link|img|script|source|iframe|area)\b[^>]*>')
+URL_ATTR_RE = re.compile(r'\s(href|src|srcset)\s*=\s*("[^"]*"|\'[^\']*\')')
+ID_RE = re.compile(r'\s(?:id|name)\s*=\s*("[^"]*"|\'[^\']*\')')
+XML_LINK_RE = re.compile(r'<(?:link|loc)>([^<]+)</|<link\b[^>]*\shref="([^"]+)"')
+
+SITE = urlsplit(SITE_URL)
+# Fragments a browser resolves without a matching id
+IMPLICIT_FRAGMENTS = {'', 'top'}
+
+
+# --- Scanning ---
+
+def site_files(root='.'):
+    """Every file of the site, as '/'-separated paths relative to `root`."""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and not d.startswith('.')]
+        rel = os.path.relpath(dirpath, root)
+        for name in filenames:
+            if not name.endswith(SKIP_SUFFIXES):
+                files.append(name if rel == '.' else posixpath.join(rel.replace(os.sep, '/'), name))
+    return files
+
+
+def html_references(text):
+    refs = []
+    for tag in TAG_RE.findall(text):
+        for attr, raw in URL_ATTR_RE.findall(tag):
+            value = html.unescape(raw[1:-1]).strip()
+            if attr == 'srcset':
+                refs += [candidate.split()[0] for candidate in value.split(',') if candidate.strip()]
+            elif value:
+                refs.append(value)
+    return refs
+
+
+def feed_references(path, text):
+    if path.endswith('.json'):
+        feed = json.loads(text)
+        refs = [feed.get('home_page_url'), feed.get('feed_url')]
+        refs += [item.get('url') for item in feed.get('items', [])]
+        return [ref for ref in refs if ref]
+    return [html.unescape(body or href).strip() for body, href in XML_LINK_RE.findall(text)]
+
+
+def scan(path, references=True):
+    """(ids defined in `path`, references made by it); runs in worker processes."""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    is_html = path.endswith('.html')
+    ids = {html.unescape(raw[1:-1]) for raw in ID_RE.findall(text)} if is_html else set()
+    if not references:
+        return ids, []
+    return ids, html_references(text) if is_html else feed_references(path, text)
+
+
+# --- Resolving ---
+
+def resolve(page, url):
+    """(site path, fragment) an internal reference points to, or None for an external one."""
+    parts = urlsplit(url)
+    if parts.scheme or parts.netloc:
+        if parts.scheme not in ('http', 'https', '') or parts.netloc != SITE.netloc:
+            return None
+        path = parts.path or '/'
+    else:
+        path = parts.path or posixpath.basename(page)
+    path = unquote(path)
+    if path.startswith('/'):
+        target = path.lstrip('/') or '.'
+    else:
+        target = posixpath.join(posixpath.dirname(page), path)
+    target = posixpath.normpath(target)
+    if path.endswith('/') or target == '.':
+        target = posixpath.normpath(posixpath.join(target, 'index.html'))
+    return target, unquote(parts.fragment)
+
+
+class LinkIndex:
+    """Paths and ids of every file of the site."""
+
+    def __init__(self, files, ids):
+        self.files = set(files)
+        self.ids = ids  # html path -> set of ids
+        # Pages of one directory share most of their links (tags, assets, neighbours)
+        self._checked = {}
+
+    def check(self, page, url):
+        """None if `url` (found in `page`) resolves, else why it doesn't."""
+        if url[:1] in ('', '#', '?'):
+            return self._check(page, url)
+        key = (posixpath.dirname(page), url)
+        if key not in self._checked:
+            self._checked[key] = self._check(page, url)
+        return self._checked[key]
+
+    def _check(self, page, url):
+        resolved = resolve(page, url)
+        if resolved is None:
+            return None
+        target, fragment = resolved
+        if target.startswith('../') or target == '..':
+            return "points outside the site"
+        if target not in self.files:
+            index = posixpath.join(target, 'index.html')
+            if index not in self.files:
+                return "no such file"
+            target = index
+        if fragment not in IMPLICIT_FRAGMENTS and target in self.ids and fragment not in self.ids[target]:
+            return f"no id '{fragment}' in {target}"
+        return None
+
+
+def checked_outputs():
+    paths = set()
+    for pattern in PATTERNS:
+        paths.update(p.replace(os.sep, '/') for p in glob.glob(pattern, recursive=True)
+                     if os.path.isfile(p))
+    return sorted(paths)
+
+
+def check_links(jobs=1):
+    """Check every reference of the generated outputs; return [(page, url, problem)]."""
+    with profiling.stage('index'):
+        files = site_files()
+        pages = checked_outputs()
+        # Other pages are only read for their ids (a fragment may point into them)
+        others = sorted(set(p for p in files if p.endswith('.html')) - set(pages))
+        work = pages + others
+        flags = [True] * len(pages) + [False] * len(others)
+        if jobs > 1 and len(work) > 1:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(work))) as pool:
+                scanned = list(pool.map(scan, work, flags, chunksize=16))
+        else:
+            scanned = [scan(path, flag) for path, flag in zip(work, flags)]
+        index = LinkIndex(files, {path: ids for path, (ids, _) in zip(work, scanned) if path.endswith('.html')})
+
+    with profiling.stage('resolve'):
+        broken = []
+        checked = 0
+        for page, (_, refs) in zip(pages, scanned):
+            for url in refs:
+                checked += 1
+                problem = index.check(page, url)
+                if problem:
+                    broken.append((page, url, problem))
+    print(f"Links: {checked} references in {len(pages)} outputs checked, {len(broken)} broken")
+    for page, url, problem in broken[:MAX_REPORTED]:
+        print(f"  {page}: {url} ({problem})")
+    if len(broken) > MAX_REPORTED:
+        print(f"  ... and {len(broken) - MAX_REPORTED} more")
+    return broken
+
+
+def add_arguments(parser):
+    parser.add_argument('--no-linkcheck', action='store_true',
+                        help="don't check the internal links and anchors of the outputs")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the internal links and anchors of the built site")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: number of CPUs, 1 = serial)")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+    with profiling.session(args):
+        broken = check_links(max(1, args.jobs))
+    if broken:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
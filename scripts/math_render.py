@@ -0,0 +1,167 @@
+"""Build-time rendering of $…$ and $$…$$ math, so pages don't run KaTeX.
+
+A Markdown inline processor picks up math spans before emphasis and
+escaping can mangle them, and replaces each with HTML rendered once per
+expression (cached in the render cache's 'math' namespace). Renderers, in
+order of preference:
+
+  katex-node  node + the vendored assets/vendor/katex.js, one long-lived
+              process per build worker (same markup as KaTeX in the browser)
+  katex-cli   a `katex` executable on PATH, one process per expression
+  mathml      the latex2mathml package, if installed
+
+With none available, or when a renderer fails, the source is kept in a
+<span class="math-pending"> and the page falls back to KaTeX's auto-render
+at runtime (see assets.page_asset_groups).
+"""
+import os
+import json
+import shutil
+import subprocess
+from html import escape
+
+from markdown.extensions import Extension
+from markdown.inlinepatterns import InlineProcessor
+
+from build_manifest import hash_bytes, hash_text
+
+try:
+    import latex2mathml
+    from latex2mathml.converter import convert as latex_to_mathml
+except ImportError:
+    latex2mathml = None
+
+KATEX_JS = 'assets/vendor/katex.js'
+
+# $$display$$ or $inline$: like pandoc, an inline span must not start or end
+# with a space and its closing $ must not be followed by a digit, so
+# "costs $5 and $10" is left alone. \$ is a literal dollar.
+MATH_RE = r'(?<![\\$])(?:\$\$(?P<display>.+?)\$\$|\$(?=\S)(?P<inline>[^$]*?[^\s\\])\$(?![\d$]))'
+
+# Reads [tex, display] JSON lines on stdin, writes one JSON string per line
+NODE_RENDERER = r"""
+const katex = require(process.argv[1]);
+require('readline').createInterface({input: process.stdin}).on('line', line => {
+  const [tex, display] = JSON.parse(line);
+  const html = katex.renderToString(tex, {displayMode: display, throwOnError: false});
+  process.stdout.write(JSON.stringify(html) + '\n');
+});
+"""
+RENDER_TIMEOUT = 30
+
+
+class KatexNode:
+    def __init__(self, node, katex_js):
+        with open(katex_js, 'rb') as f:
+            self.name = f"katex-node:{hash_bytes(f.read())[:16]}"
+        self.args = [node, '-e', NODE_RENDERER, os.path.abspath(katex_js)]
+        self.proc = None
+        self.failed = False
+
+    def render(self, tex, display):
+        if self.failed:
+            return None
+        if self.proc is None:
+            self.proc = subprocess.Popen(self.args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         text=True, encoding='utf-8')
+        try:
+            self.proc.stdin.write(json.dumps([tex, display]) + '\n')
+            self.proc.stdin.flush()
+            line = self.proc.stdout.readline()
+        except OSError:
+            line = ''
+        if not line:
+            # The renderer died; don't try it again in this process
+            self.proc.kill()
+            self.failed = True
+            return None
+        return json.loads(line)
+
+
+class KatexCli:
+    def __init__(self, cli):
+        version = subprocess.run([cli, '--version'], capture_output=True, text=True).stdout.strip()
+        self.name = f"katex-cli:{version}"
+        self.cli = cli
+
+    def render(self, tex, display):
+        args = [self.cli, '--no-throw-on-error'] + (['--display-mode'] if display else [])
+        try:
+            result = subprocess.run(args, input=tex, capture_output=True, text=True,
+                                    encoding='utf-8', timeout=RENDER_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        return result.stdout.strip() if result.returncode == 0 else None
+
+
+class MathML:
+    name = f"mathml:{getattr(latex2mathml, '__version__', '')}"
+
+    def render(self, tex, display):
+        try:
+            return latex_to_mathml(tex, display='block' if display else 'inline')
+        except Exception:
+            # latex2mathml raises assorted errors on TeX it doesn't support
+            return None
+
+
+class NoRenderer:
+    name = 'none'
+
+    def render(self, tex, display):
+        return None
+
+
+_renderer = None
+
+def math_renderer():
+    """The best renderer available in this process (created once)."""
+    global _renderer
+    if _renderer is None:
+        node = shutil.which('node')
+        cli = shutil.which('katex')
+        if node and os.path.exists(KATEX_JS):
+            _renderer = KatexNode(node, KATEX_JS)
+        elif cli:
+            _renderer = KatexCli(cli)
+        elif latex2mathml:
+            _renderer = MathML()
+        else:
+            _renderer = NoRenderer()
+    return _renderer
+
+
+def pending_html(tex, display):
+    delim = '$$' if display else '$'
+    return f'<span class="math-pending">{escape(delim + tex + delim, quote=False)}</span>'
+
+
+class MathInlineProcessor(InlineProcessor):
+    def __init__(self, md, cache, renderer):
+        super().__init__(MATH_RE, md)
+        self.cache = cache
+        self.renderer = renderer
+
+    def handleMatch(self, m, data):
+        display = m.group('display') is not None
+        tex = (m.group('display') if display else m.group('inline')).strip()
+        key = hash_text(json.dumps([self.renderer.name, tex, display]))
+        html = self.cache.get('math', key)
+        if html is None:
+            html = self.renderer.render(tex, display)
+            if html is None:
+                html = pending_html(tex, display)
+            else:
+                self.cache.put('math', key, html)
+        return self.md.htmlStash.store(html), m.start(0), m.end(0)
+
+
+class MathExtension(Extension):
+    def __init__(self, cache, renderer=None, **kwargs):
+        self.cache = cache
+        self.renderer = renderer or math_renderer()
+        super().__init__(**kwargs)
+
+    def extendMarkdown(self, md):
+        # Above 'escape' (180) and below 'backtick' (190): `$x$` in code stays code
+        md.inlinePatterns.register(MathInlineProcessor(md, self.cache, self.renderer), 'math', 185)
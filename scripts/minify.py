@@ -0,0 +1,356 @@
+"""Minified pages, optionally with the critical part of the stylesheet inlined.
+
+HtmlMinifier minifies a page while it streams out, leaving <pre> and
+<textarea> untouched; with critical CSS (--critical-css) each page also
+inlines the stylesheet rules its above-the-fold markup uses and loads the
+rest asynchronously.
+"""
+import re
+import hashlib
+import itertools
+
+from output import stream_if_changed
+
+FOLD_CHARS = 6000
+
+BLOCK_TAGS = frozenset("""
+    !doctype html head body title meta link script style noscript base
+    div p ul ol li dl dt dd h1 h2 h3 h4 h5 h6 nav header footer main section article aside
+    figure figcaption blockquote pre hr table caption thead tbody tfoot tr th td form fieldset
+    details summary source
+""".split())
+
+WS_RE = re.compile(r'\s+')
+TAG_NAME_RE = re.compile(r'</?(!?[a-zA-Z][\w-]*)')
+RAW_OPEN_RE = re.compile(r'<(pre|textarea|script|style)\b[^>]*>', re.IGNORECASE)
+RAW_CLOSE_RE = {name: re.compile(rf'</{name}\s*>', re.IGNORECASE)
+                for name in ('pre', 'textarea', 'script', 'style')}
+KEEP_COMMENT_RE = re.compile(r'<!-- /?region:\w+ -->$')
+
+CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+CSS_PUNCT_RE = re.compile(r'\s*([{};,>])\s*')
+CSS_COLON_RE = re.compile(r':\s+')
+
+
+# --- Inline code ---
+
+def minify_js(code):
+    """Conservative minification: strip indentation, blank lines and whole-line // comments."""
+    if '`' in code:
+        # Template literals may hold significant whitespace
+        return code
+    lines = [line.strip() for line in code.split('\n')]
+    kept = [line for line in lines if line and not line.startswith('//')]
+    return '\n' + '\n'.join(kept) + '\n' if kept else ''
+
+
+def minify_css(css):
+    css = WS_RE.sub(' ', CSS_COMMENT_RE.sub('', css))
+    return CSS_PUNCT_RE.sub(r'\1', css).replace(';}', '}').strip()
+
+
+RAW_FILTERS = {
+    'pre': lambda text: text,
+    'textarea': lambda text: text,
+    'script': minify_js,
+    'style': minify_css,
+}
+
+
+# --- HTML ---
+
+class HtmlMinifier:
+    """Streaming minifier: write() pieces of a page, close() at the end.
+
+    Pieces may split the markup anywhere; whatever can't be decided yet
+    (an unfinished tag, a <pre> without its end tag, trailing text) is
+    held back until the next piece.
+    """
+
+    def __init__(self, write):
+        self._write = write
+        self.buf = ''
+        self.last_tag = '!doctype'
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def write(self, text):
+        self.bytes_in += len(text.encode('utf-8'))
+        self.buf += text
+        self._drain(final=False)
+
+    def close(self):
+        self._drain(final=True)
+
+    def _emit(self, out):
+        text = ''.join(out)
+        self.bytes_out += len(text.encode('utf-8'))
+        self._write(text)
+
+    def _drain(self, final):
+        buf = self.buf
+        n = len(buf)
+        pos = 0
+        out = []
+        while pos < n:
+            if buf[pos] != '<':
+                end = buf.find('<', pos)
+                if end < 0:
+                    if not final:
+                        break
+                    end = n
+                text = buf[pos:end]
+                if text.isspace():
+                    following = TAG_NAME_RE.match(buf, end)
+                    if following is None and end < n and not final and buf.find('>', end) < 0:
+                        break
+                    following = following.group(1).lower() if following else None
+                    if self.last_tag in BLOCK_TAGS or following in BLOCK_TAGS or following is None:
+                        text = ''
+                out.append(WS_RE.sub(' ', text))
+                pos = end
+                continue
+
+            if buf.startswith('<!--', pos):
+                end = buf.find('-->', pos + 4)
+                if end < 0:
+                    break
+                comment = buf[pos:end + 3]
+                if KEEP_COMMENT_RE.match(comment):
+                    out.append(comment)
+                pos = end + 3
+                continue
+
+            raw = RAW_OPEN_RE.match(buf, pos)
+            if raw:
+                name = raw.group(1).lower()
+                close = RAW_CLOSE_RE[name].search(buf, raw.end())
+                if close is None:
+                    break
+                out += [raw.group(0), RAW_FILTERS[name](buf[raw.end():close.start()]), close.group(0)]
+                self.last_tag = name
+                pos = close.end()
+                continue
+
+            end = buf.find('>', pos)
+            if end < 0:
+                break
+            name = TAG_NAME_RE.match(buf, pos)
+            self.last_tag = name.group(1).lower() if name else None
+            out.append(buf[pos:end + 1])
+            pos = end + 1
+
+        if final and pos < n:
+            # An unterminated construct is written as it came
+            out.append(buf[pos:])
+            pos = n
+        self.buf = buf[pos:]
+        if out:
+            self._emit(out)
+
+
+def minify_html(text):
+    """Minified copy of a complete page or fragment."""
+    out = []
+    minifier = HtmlMinifier(out.append)
+    minifier.write(text)
+    minifier.close()
+    return ''.join(out)
+
+
+# --- Critical CSS ---
+
+STATE_RE = re.compile(r':(hover|focus|focus-within|focus-visible|active|visited|target|checked)\b')
+COMBINATOR_RE = re.compile(r'\s*[>+~]\s*|\s+')
+ATTRIBUTE_RE = re.compile(r'\[[^\]]*\]')
+PSEUDO_RE = re.compile(r'::?[\w-]+(\([^)]*\))?')
+SIMPLE_RE = re.compile(r'^[a-zA-Z][\w-]*|[.#][\w-]+')
+NESTED_AT_RULES = ('@media', '@supports')
+
+PAGE_TAG_RE = re.compile(r'<([a-zA-Z][\w-]*)')
+PAGE_ATTR_RE = re.compile(r'\b(class|id)=["\']([^"\']*)["\']')
+
+
+def parse_css(text):
+    """[(prelude, body)] of a stylesheet; body is the declarations, or a nested list for at-rules."""
+    rules, _ = _parse_rules(CSS_COMMENT_RE.sub('', text), 0)
+    return rules
+
+
+def _parse_rules(text, pos):
+    rules = []
+    while True:
+        open_brace = text.find('{', pos)
+        close_brace = text.find('}', pos)
+        if open_brace < 0 or 0 <= close_brace < open_brace:
+            return rules, (len(text) if close_brace < 0 else close_brace + 1)
+        # Statement at-rules (@import, @charset) before the block are not kept
+        prelude = text[pos:open_brace].rsplit(';', 1)[-1].strip()
+        if prelude.startswith('@') and not prelude.startswith(('@font-face', '@page')):
+            inner, pos = _parse_rules(text, open_brace + 1)
+            rules.append((prelude, inner))
+        else:
+            end = text.find('}', open_brace)
+            if end < 0:
+                end = len(text)
+            rules.append((prelude, text[open_brace + 1:end]))
+            pos = end + 1
+
+
+def selector_needs(selector):
+    """The elements, .classes and #ids a selector names, or None for a state (:hover) rule."""
+    if STATE_RE.search(selector):
+        return None
+    needs = set()
+    for compound in COMBINATOR_RE.split(selector.strip()):
+        compound = PSEUDO_RE.sub('', ATTRIBUTE_RE.sub('', compound))
+        needs.update(name.lower() if name[0] not in '.#' else name for name in SIMPLE_RE.findall(compound))
+    return frozenset(needs)
+
+
+class Stylesheet:
+    """A parsed stylesheet that can produce the subset of rules a page needs."""
+
+    def __init__(self, text):
+        self.digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        # [(alternative needs, minified rule)] or (media prelude, nested list)
+        self.rules = self._prepare(parse_css(text))
+        self._subsets = {}
+
+    def _prepare(self, rules):
+        prepared = []
+        for prelude, body in rules:
+            if isinstance(body, list):
+                if prelude.startswith(NESTED_AT_RULES):
+                    prepared.append((minify_css(prelude), self._prepare(body)))
+                continue
+            if prelude.startswith('@'):
+                continue
+            needs = [n for n in (selector_needs(s) for s in prelude.split(',')) if n is not None]
+            if needs:
+                # Inside a declaration block `name: value` can lose its space too
+                declarations = CSS_COLON_RE.sub(':', minify_css(body))
+                prepared.append((needs, f"{minify_css(prelude)}{{{declarations}}}"))
+        return prepared
+
+    def critical(self, tokens):
+        """Minified rules matching a page whose above-the-fold markup uses `tokens`."""
+        key = frozenset(tokens)
+        if key not in self._subsets:
+            self._subsets[key] = ''.join(self._select(self.rules, key))
+        return self._subsets[key]
+
+    def _select(self, rules, tokens):
+        for first, second in rules:
+            if isinstance(second, list):
+                inner = ''.join(self._select(second, tokens))
+                if inner:
+                    yield f"{first}{{{inner}}}"
+            elif any(needs <= tokens for needs in first):
+                yield second
+
+
+def markup_tokens(text, tokens):
+    """Add the element names, .classes and #ids used in `text` to `tokens`."""
+    tokens.update(name.lower() for name in PAGE_TAG_RE.findall(text))
+    for kind, value in PAGE_ATTR_RE.findall(text):
+        prefix = '.' if kind == 'class' else '#'
+        tokens.update(prefix + name for name in value.split())
+
+
+def above_fold_tokens(template, context, limit=FOLD_CHARS):
+    """Tokens of the first `limit` characters `template` renders for `context`.
+
+    Iterable values are peeked through itertools.tee, so a generator in
+    the context is still rendered in full afterwards.
+    """
+    tokens = set()
+    budget = limit
+    for part in template.parts:
+        if budget <= 0:
+            break
+        if isinstance(part, str):
+            pieces = [part]
+        else:
+            value = context.get(part[1], '')
+            if value.__class__ is str:
+                pieces = [value]
+            else:
+                pieces, context[part[1]] = itertools.tee(value)
+        for piece in pieces:
+            markup_tokens(piece[:budget], tokens)
+            budget -= len(piece)
+            if budget <= 0:
+                break
+    return tokens
+
+
+def stylesheet_tags(href, critical=None):
+    """Markup loading the stylesheet: a plain link, or `critical` inlined and the rest deferred."""
+    if critical is None:
+        return f'<link rel="stylesheet" href="{href}">'
+    return (f'<style>{critical}</style>'
+            f'<link rel="preload" href="{href}" as="style" onload="this.onload=null;this.rel=\'stylesheet\'">'
+            f'<noscript><link rel="stylesheet" href="{href}"></noscript>')
+
+
+# --- Pages ---
+
+class PageOptimizer:
+    """Renders templates minified and, with `critical_css`, the critical rules of `stylesheet_path` inlined."""
+
+    def __init__(self, stylesheet_path, critical_css=False):
+        # None: pages link the whole stylesheet
+        self.stylesheet = None
+        if critical_css:
+            with open(stylesheet_path, encoding='utf-8') as f:
+                self.stylesheet = Stylesheet(f.read())
+        # path -> (bytes before, bytes after, bytes of inlined CSS), for pages rendered this run
+        self.pages = {}
+
+    @property
+    def signature(self):
+        """Changes with anything that changes optimized pages for the same content."""
+        return self.stylesheet.digest if self.stylesheet else 'linked'
+
+    def render_to(self, template, path, context, href, slug=None):
+        """Stream the optimized page into `path` (only replaced if it changed); return True if written.
+
+        The template's head renders context['stylesheet'], filled in here.
+        """
+        critical = self.stylesheet.critical(above_fold_tokens(template, context)) if self.stylesheet else None
+        context['stylesheet'] = stylesheet_tags(href, critical)
+        with stream_if_changed(path, slug) as out:
+            minifier = HtmlMinifier(out.write)
+            template.render(minifier.write, context)
+            minifier.close()
+        # What the page would have been: unminified, linking the full stylesheet
+        inlined = len(context['stylesheet'].encode('utf-8')) - len(stylesheet_tags(href).encode('utf-8'))
+        self.pages[path] = (minifier.bytes_in - inlined, minifier.bytes_out, len((critical or '').encode('utf-8')))
+        return out.written
+
+    def minify_fragment(self, name, text):
+        """Minify a generated fragment of a hand-maintained page, counted in the report as `name`."""
+        minified = minify_html(text)
+        self.pages[name] = (len(text.encode('utf-8')), len(minified.encode('utf-8')), 0)
+        return minified
+
+    def summary(self):
+        before, after, css = (sum(column) for column in zip(*self.pages.values())) if self.pages else (0, 0, 0)
+        summary = (f"Optimized pages: {len(self.pages)} rendered, markup {before} -> {after - css} bytes "
+                   f"({_change(before, after - css)})")
+        if self.stylesheet is None:
+            return summary
+        return f"{summary}, plus {css} bytes of inlined critical CSS"
+
+    def report(self):
+        """Per-page sizes: as rendered, as written, and how much of that is inlined CSS."""
+        lines = [f"{'page':<60} {'before':>9} {'after':>9} {'css':>7} {'markup':>7}"]
+        for path, (before, after, css) in sorted(self.pages.items(), key=lambda item: item[1][1] - item[1][2] - item[1][0]):
+            lines.append(f"{path:<60} {before:>9} {after:>9} {css:>7} {_change(before, after - css):>7}")
+        return '\n'.join(lines)
+
+
+def _change(before, after):
+    """Signed size change in percent: negative when the page shrank."""
+    return f"{100 * (after - before) / before if before else 0.0:+.1f}%"
@@ -0,0 +1,138 @@
+"""Previous/next links and collection series, from one date-sorted index.
+
+Posts are sorted once; every post's position in the full list and in its
+collection is stored, so its neighbours are looked up in O(1) instead of
+scanning the list per page. A post page shows its chronological
+neighbours and, for a post in a `collection`, its part number and the
+neighbouring parts; the series page under weblog/series/<name>/ is the
+table of contents. A collection only becomes a series once it has
+SERIES_MIN_PARTS posts.
+
+`page_links()` is what a post page shows of its neighbours, so including
+it in the page signature means adding a post only rewrites the pages
+next to it (and its series page), not every page of the weblog.
+
+Listings (the weblog index and the tag pages) show their PAGE_SIZE newest
+posts; older ones are split into archive pages <listing>/page/<k>/.
+"""
+import os
+import re
+import shutil
+import hashlib
+from collections import Counter
+
+SERIES_DIR = 'weblog/series'
+PAGE_SIZE = 10
+SERIES_MIN_PARTS = 2
+
+
+def series_slug(name):
+    return re.sub(r'[^a-z0-9]+', '-', str(name).lower()).strip('-')
+
+
+def tag_slug(tag):
+    """File name (without extension) of a tag's pages and feed.
+
+    A tag made of URL-safe characters keeps its name, so existing tag
+    URLs don't move. In others, characters that can't appear in a path
+    segment as they are (spaces, slashes, ...) become '-' and a short
+    hash of the tag is appended, so "a b", "a/b" and "a-b" stay apart.
+    """
+    name = str(tag)
+    slug = re.sub(r'[^A-Za-z0-9_+-]+', '-', name).strip('-')
+    if slug == name:
+        return slug
+    return f"{slug or 'tag'}-{hashlib.sha256(name.encode('utf-8')).hexdigest()[:6]}"
+
+
+def series_names(posts):
+    """Names of the collections with enough posts to be a series."""
+    counts = Counter(str(p.collection) for p in posts if p.collection)
+    return {name for name, count in counts.items() if count >= SERIES_MIN_PARTS}
+
+
+def check_tag_slugs(tags):
+    """Fail the build if two distinct tags would share a page (e.g. 1 and '1' in frontmatter)."""
+    seen = {}
+    for tag in tags:
+        other = seen.setdefault(tag_slug(tag), tag)
+        if other is not tag:
+            raise SystemExit(f"Tags {other!r} and {tag!r} would share weblog/tags/{tag_slug(tag)}.html")
+
+
+def paginate(posts, size):
+    """Split posts (oldest first) into fixed chunks: page k keeps the same posts as newer ones arrive."""
+    return [posts[i:i + size] for i in range(0, len(posts), size)]
+
+
+def archive_pages(posts, size):
+    """[(k, posts of archive page k)] for a listing of `posts` (oldest first); none if they all fit."""
+    return list(enumerate(paginate(posts, size), start=1)) if len(posts) > size else []
+
+
+def older_page_number(count, size):
+    """Archive page holding the newest post that no longer fits on a landing page, or None."""
+    if count <= size:
+        return None
+    return (count - size - 1) // size + 1
+
+
+class PostIndex:
+    """Posts in date order with O(1) neighbour and series lookups."""
+
+    def __init__(self, posts):
+        self.posts = sorted(posts, key=lambda p: p.date)
+        self.position = {}
+        self.collections = {}
+        self.part = {}
+        series = series_names(self.posts)
+        for i, post in enumerate(self.posts):
+            self.position[post.slug] = i
+            if post.collection and str(post.collection) in series:
+                members = self.collections.setdefault(str(post.collection), [])
+                self.part[post.slug] = len(members)
+                members.append(post)
+
+    def neighbors(self, post):
+        """(older post or None, newer post or None)."""
+        i = self.position[post.slug]
+        return (self.posts[i - 1] if i > 0 else None,
+                self.posts[i + 1] if i + 1 < len(self.posts) else None)
+
+    def series(self, post):
+        """(name, 1-based part, previous part or None, next part or None), or None."""
+        if post.slug not in self.part:
+            return None
+        name = str(post.collection)
+        members = self.collections[name]
+        k = self.part[post.slug]
+        return (name, k + 1,
+                members[k - 1] if k > 0 else None,
+                members[k + 1] if k + 1 < len(members) else None)
+
+    def page_links(self, post):
+        """JSON-able summary of the neighbours a post page links to (part of its signature)."""
+        def link(p):
+            return p and (p.slug, p.title)
+        older, newer = self.neighbors(post)
+        series = self.series(post)
+        if series:
+            name, part, prev_part, next_part = series
+            series = (name, part, link(prev_part), link(next_part))
+        return [link(older), link(newer), series]
+
+
+def series_path(name):
+    return os.path.join(SERIES_DIR, series_slug(name), 'index.html')
+
+
+def prune_series(names):
+    """Remove series pages of collections that no longer have any posts."""
+    if not os.path.isdir(SERIES_DIR):
+        return
+    keep = {series_slug(name) for name in names}
+    for entry in os.listdir(SERIES_DIR):
+        if entry not in keep and os.path.isdir(os.path.join(SERIES_DIR, entry)):
+            shutil.rmtree(os.path.join(SERIES_DIR, entry))
+    if not os.listdir(SERIES_DIR):
+        os.rmdir(SERIES_DIR)
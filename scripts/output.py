@@ -0,0 +1,140 @@
+"""Atomic, write-avoiding file output shared by the generators.
+
+Pages are usually regenerated byte-for-byte identical; rewriting them
+would still bump mtimes and churn git and the Pages deploy, so
+write_if_changed() compares with what is on disk and only replaces files
+whose content differs. stream_if_changed() does the same for pages
+rendered piece by piece (see templates.py) without assembling them
+first. `stats` counts both outcomes for the build summary.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+import profiling
+
+
+class OutputStats:
+    def __init__(self):
+        self.written = 0
+        self.skipped = 0
+
+    def summary(self):
+        return f"Output files: {self.written} written, {self.skipped} unchanged"
+
+
+stats = OutputStats()
+
+
+@contextmanager
+def atomic_open(path, mode='w', encoding='utf-8'):
+    """Write to a temp file next to `path` and rename it into place on success.
+
+    Readers (and an interrupted build) never see a half-written file.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.')
+    try:
+        # mkstemp creates the file 0600; published files must be world-readable
+        os.chmod(tmp, 0o644)
+        with open(fd, mode, encoding=None if 'b' in mode else encoding) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def unchanged(path, data):
+    """True (and counted as skipped) if `path` already holds exactly `data` (bytes)."""
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+        with open(path, 'rb') as f:
+            same = f.read() == data
+    except OSError:
+        return False
+    if same:
+        stats.skipped += 1
+    return same
+
+
+def write_if_changed(path, content, slug=None):
+    """Atomically write `content` (str or bytes) unless `path` already has it; return True if written.
+
+    `slug` attributes the bytes to a post in --profile reports.
+    """
+    data = content.encode('utf-8') if isinstance(content, str) else content
+    if unchanged(path, data):
+        return False
+    with atomic_open(path, 'wb') as f:
+        f.write(data)
+    stats.written += 1
+    profiling.record_output(path, slug)
+    return True
+
+
+class OutputStream:
+    """File-like writer that streams into a temp file next to `path`.
+
+    Each chunk is compared with the same range of the existing file as it
+    arrives, so when the page turns out identical the temp file is simply
+    dropped: no full-document string is ever built, and unchanged files
+    keep their mtime. Use through stream_if_changed().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.')
+        os.chmod(self.tmp, 0o644)
+        self.file = open(fd, 'wb')
+        try:
+            self.existing = open(path, 'rb')
+        except OSError:
+            self.existing = None
+        self.same = self.existing is not None
+        self.written = False
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.file.write(data)
+        if self.same and self.existing.read(len(data)) != data:
+            self.same = False
+
+    def finish(self, slug=None):
+        self.file.close()
+        if self.existing is not None:
+            self.same = self.same and self.existing.read(1) == b''
+            self.existing.close()
+        if self.same:
+            os.unlink(self.tmp)
+            stats.skipped += 1
+            return
+        os.replace(self.tmp, self.path)
+        self.written = True
+        stats.written += 1
+        profiling.record_output(self.path, slug)
+
+    def abort(self):
+        self.file.close()
+        if self.existing is not None:
+            self.existing.close()
+        os.unlink(self.tmp)
+
+
+@contextmanager
+def stream_if_changed(path, slug=None):
+    """Stream a file's content through `.write(str)`; it replaces `path` only if it differs.
+
+    After the block, `.written` tells whether the file was replaced.
+    """
+    out = OutputStream(path)
+    try:
+        yield out
+    except BaseException:
+        out.abort()
+        raise
+    out.finish(slug)
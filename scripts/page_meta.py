@@ -0,0 +1,250 @@
+"""Streaming extractors for the few fields the feeds need from HTML and RSS files.
+
+Replaces building a full BeautifulSoup DOM per page: HTMLParser is fed the
+file a chunk at a time and reading stops as soon as the wanted fields are
+known, so the cost of a page does not grow with its body.
+"""
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
+
+CHUNK_SIZE = 8192
+
+
+class _Done(Exception):
+    """Raised from a parser callback once everything needed has been seen."""
+
+
+def _feed_file(parser, path):
+    with open(path, encoding="utf-8") as f:
+        try:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                parser.feed(chunk)
+            parser.close()
+        except _Done:
+            pass
+    return parser
+
+
+class HeadMetaParser(HTMLParser):
+    """Collect <title> and <meta name="description">, stopping at <body>."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.description = None
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'title' and self.title is None:
+            self._in_title = True
+            self.title = ''
+        elif tag == 'meta' and self.description is None:
+            attrs = dict(attrs)
+            if attrs.get('name') == 'description':
+                self.description = attrs.get('content') or ''
+        elif tag == 'body':
+            raise _Done
+        self._check_done()
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self._in_title = False
+            self._check_done()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+
+    def _check_done(self):
+        if self.title is not None and not self._in_title and self.description is not None:
+            raise _Done
+
+
+def read_head_meta(path):
+    """Return (title, description) of an HTML page; either may be None if absent."""
+    parser = _feed_file(HeadMetaParser(), path)
+    return parser.title, parser.description
+
+
+class ProjectListParser(HTMLParser):
+    """Collect the first link and the .subheading text of every <div class="project">."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.projects = []
+        self._project = None
+        self._div_depth = 0
+        # Element whose text is currently being captured ('title' or 'description')
+        self._field = None
+        self._field_tag = None
+        self._field_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        if self._project is None:
+            if tag == 'div' and 'project' in classes:
+                self._project = {'href': None, 'title': None, 'description': None}
+                self._div_depth = 1
+            return
+        if tag == 'div':
+            self._div_depth += 1
+        if self._field:
+            if tag == self._field_tag:
+                self._field_depth += 1
+            return
+        if tag == 'a' and self._project['title'] is None:
+            self._project['href'] = attrs.get('href')
+            self._capture('title', tag)
+        elif 'subheading' in classes and self._project['description'] is None:
+            self._capture('description', tag)
+
+    def handle_endtag(self, tag):
+        if self._project is None:
+            return
+        if self._field and tag == self._field_tag:
+            self._field_depth -= 1
+            if self._field_depth == 0:
+                self._field = None
+        if tag == 'div':
+            self._div_depth -= 1
+            if self._div_depth == 0:
+                if self._project['title'] is not None and self._project['href']:
+                    self.projects.append(self._project)
+                self._project = None
+
+    def handle_data(self, data):
+        if self._field:
+            self._project[self._field] += data
+
+    def _capture(self, field, tag):
+        self._project[field] = ''
+        self._field = field
+        self._field_tag = tag
+        self._field_depth = 1
+
+
+def read_projects(path):
+    """Return [{'title', 'href', 'description'}] for the project cards on a page."""
+    projects = _feed_file(ProjectListParser(), path).projects
+    for project in projects:
+        project['title'] = project['title'].strip()
+        project['description'] = (project['description'] or '').strip()
+    return projects
+
+
+class SummaryParser(HTMLParser):
+    """Plain text of the <p> elements of a page, stopping after `limit` characters.
+
+    Scripts, buttons, SVG icons and anything aria-hidden are skipped, as is
+    the TeX annotation KaTeX keeps next to its MathML, so code toolbars and
+    math markup don't leak into the text.
+    """
+
+    SKIP_TAGS = {'script', 'style', 'svg', 'button', 'annotation', 'annotation-xml'}
+    VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                 'source', 'track', 'wbr'}
+
+    def __init__(self, limit):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.parts = []
+        self.length = 0
+        self._paragraph = 0
+        self._skip_tag = None
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.VOID_TAGS:
+            if tag == 'br' and self._paragraph and not self._skip_tag:
+                self.parts.append(' ')
+            return
+        if self._skip_tag:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        if tag in self.SKIP_TAGS or dict(attrs).get('aria-hidden') == 'true':
+            self._skip_tag = tag
+            self._skip_depth = 1
+        elif tag == 'p':
+            self._paragraph += 1
+
+    def handle_endtag(self, tag):
+        if self._skip_tag:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    self._skip_tag = None
+            return
+        if tag == 'p' and self._paragraph:
+            self._paragraph -= 1
+            self.parts.append(' ')
+            if self.length >= self.limit:
+                raise _Done
+
+    def handle_data(self, data):
+        if self._paragraph and not self._skip_tag:
+            self.parts.append(data)
+            self.length += len(data)
+
+    def text(self):
+        return truncate_text(' '.join(''.join(self.parts).split()), self.limit)
+
+
+def truncate_text(text, limit):
+    """Cut `text` to at most `limit` characters at a word boundary."""
+    if len(text) <= limit:
+        return text
+    cut = text[:limit - 1]
+    space = cut.rfind(' ')
+    if space > limit // 2:
+        cut = cut[:space]
+    return cut.rstrip(' ,;:.') + '…'
+
+
+def html_summary(html, limit):
+    """Plain-text summary of an HTML fragment (see SummaryParser)."""
+    parser = SummaryParser(limit)
+    try:
+        parser.feed(html)
+        parser.close()
+    except _Done:
+        pass
+    return parser.text()
+
+
+def read_summary(path, limit):
+    """Plain-text summary of an HTML file, read only as far as needed."""
+    return _feed_file(SummaryParser(limit), path).text()
+
+
+def iter_feed_items(path):
+    """Yield the <item> children of an RSS file as dicts, one element at a time."""
+    fields = ('title', 'link', 'description', 'pubDate', 'category')
+    try:
+        for _, elem in ET.iterparse(path, events=('end',)):
+            if elem.tag != 'item':
+                continue
+            yield {field: elem.findtext(field) or '' for field in fields}
+            elem.clear()
+    except ET.ParseError as e:
+        print(f"Stopped reading {path}: {e}")
+
+
+def read_last_build_date(path):
+    """The channel's <lastBuildDate> text, or None; stops reading at the first item."""
+    try:
+        for _, elem in ET.iterparse(path, events=('end',)):
+            if elem.tag == 'lastBuildDate':
+                return elem.text
+            if elem.tag == 'item':
+                break
+    except (OSError, ET.ParseError):
+        pass
+    return None
@@ -0,0 +1,143 @@
+"""Per-stage and per-post timing for the site generators (--profile).
+
+Call sites wrap work in `with profiling.stage('name'):` and every file
+actually written goes through `profiling.record_output(path)` (called by
+output.py, and by compress.py, assets.py and images.py for the files they
+write themselves); both are no-ops unless a profile session is
+running, so the instrumentation stays in place in normal builds. Stages
+nest: 'render' inside 'build' is reported as 'build/render'. Bytes
+written are charged to the innermost open stage.
+
+Post rendering runs in worker processes, so workers return their own
+timings and the parent adds them with `record_post()`; those stages sum
+CPU time over all workers rather than wall time.
+"""
+import os
+import json
+import time
+import cProfile
+from contextlib import contextmanager, nullcontext
+
+SLOWEST_POSTS = 10
+
+
+class Profiler:
+    def __init__(self):
+        self.stages = {}   # path -> {'seconds', 'calls', 'bytes', 'files'}
+        self.posts = {}    # slug -> {stage: seconds, 'bytes': n}
+        self._stack = []
+
+    def _entry(self, path):
+        return self.stages.setdefault(path, {'seconds': 0.0, 'calls': 0, 'bytes': 0, 'files': 0})
+
+    @contextmanager
+    def stage(self, name):
+        self._stack.append(name)
+        # Created on entry, so parents are listed before their sub-stages
+        entry = self._entry('/'.join(self._stack))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry['seconds'] += time.perf_counter() - start
+            entry['calls'] += 1
+            self._stack.pop()
+
+    def record_output(self, path, slug=None):
+        size = os.path.getsize(path)
+        entry = self._entry('/'.join(self._stack) or 'other')
+        entry['bytes'] += size
+        entry['files'] += 1
+        if slug is not None:
+            post = self.posts.setdefault(slug, {})
+            post['bytes'] = post.get('bytes', 0) + size
+
+    def record_post(self, slug, timings):
+        """Add per-post stage timings (seconds), e.g. from a render worker."""
+        post = self.posts.setdefault(slug, {})
+        prefix = '/'.join(self._stack)
+        for name, seconds in timings.items():
+            post[name] = post.get(name, 0.0) + seconds
+            entry = self._entry(f"{prefix}/{name}" if prefix else name)
+            entry['seconds'] += seconds
+            entry['calls'] += 1
+
+    def slowest_posts(self, n=SLOWEST_POSTS):
+        def total(item):
+            return sum(v for k, v in item[1].items() if k != 'bytes')
+        return sorted(self.posts.items(), key=total, reverse=True)[:n]
+
+    def to_json(self):
+        return {'stages': self.stages, 'posts': self.posts}
+
+    def report(self):
+        lines = [f"{'stage':<36} {'seconds':>9} {'calls':>7} {'files':>6} {'bytes':>11}"]
+        for path, entry in self.stages.items():
+            lines.append(f"{path:<36} {entry['seconds']:>9.3f} {entry['calls']:>7} "
+                         f"{entry['files']:>6} {entry['bytes']:>11}")
+        slowest = self.slowest_posts()
+        if slowest:
+            lines.append('')
+            lines.append("slowest posts:")
+            for slug, timings in slowest:
+                parts = ', '.join(f"{k} {v * 1000:.1f}ms" for k, v in sorted(timings.items()) if k != 'bytes')
+                lines.append(f"  {slug:<34} {parts}")
+        return '\n'.join(lines)
+
+
+_active = None
+
+
+def stage(name):
+    return _active.stage(name) if _active else nullcontext()
+
+
+def record_output(path, slug=None):
+    if _active:
+        _active.record_output(path, slug)
+
+
+def record_post(slug, timings):
+    if _active:
+        _active.record_post(slug, timings)
+
+
+def add_arguments(parser):
+    parser.add_argument('--profile', action='store_true',
+                        help="print wall time, calls and bytes written per stage and the slowest posts")
+    parser.add_argument('--profile-json', metavar='PATH',
+                        help="also write the stage and per-post timings as JSON (implies --profile)")
+    parser.add_argument('--profile-cprofile', metavar='PATH',
+                        help="also dump cProfile stats of the main process, for pstats/snakeviz (implies --profile)")
+
+
+@contextmanager
+def session(args):
+    """Profile the enclosed build if any of the --profile options were given."""
+    global _active
+    if not (args.profile or args.profile_json or args.profile_cprofile):
+        yield None
+        return
+    _active = profiler = Profiler()
+    cprofile = cProfile.Profile() if args.profile_cprofile else None
+    start = time.perf_counter()
+    if cprofile:
+        cprofile.enable()
+    try:
+        yield profiler
+    finally:
+        if cprofile:
+            cprofile.disable()
+        _active = None
+    total = profiler._entry('total')
+    total['seconds'] = time.perf_counter() - start
+    total['calls'] = 1
+    total['bytes'] = sum(e['bytes'] for e in profiler.stages.values())
+    total['files'] = sum(e['files'] for e in profiler.stages.values())
+    print(profiler.report())
+    if args.profile_json:
+        os.makedirs(os.path.dirname(args.profile_json) or '.', exist_ok=True)
+        with open(args.profile_json, 'w', encoding='utf-8') as f:
+            json.dump(profiler.to_json(), f, indent=1, sort_keys=True)
+    if cprofile:
+        cprofile.dump_stats(args.profile_cprofile)
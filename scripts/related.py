@@ -0,0 +1,169 @@
+"""Related posts from shared tags and TF-IDF similarity of post bodies.
+
+Both signals are accumulated over inverted indexes (term -> posts and
+tag -> posts), so a post is only ever compared with the posts it shares
+a term or a tag with, never with every other post. Only the strongest
+QUERY_TERMS terms of a post are looked up, and terms used by more than
+MAX_DF of all posts are dropped, which keeps the work per post bounded
+as the weblog grows.
+
+Term counts are cached per source hash, so after an edit only that post
+is re-tokenized; scoring is recomputed, and the post pages whose related
+list actually changed are rewritten (their signature includes it).
+"""
+import math
+import json
+import heapq
+from itertools import combinations
+from collections import Counter, defaultdict
+
+from output import write_if_changed
+from render_cache import cache_key
+from search_index import MARKUP_RE, tokenize
+
+RELATED_FILE = 'weblog/related.json'
+RELATED_COUNT = 5
+QUERY_TERMS = 32
+MAX_DF = 0.5
+# Tags that co-occur with a post's tags count for less than shared tags
+RELATED_TAGS = 3
+# Newest posts of each tag considered as candidates; caps the work for big tags
+TAG_CANDIDATES = 20
+COOCCURRENCE_WEIGHT = 0.5
+TAG_WEIGHT = 0.5
+TEXT_WEIGHT = 0.5
+MIN_SCORE = 0.05
+
+
+def body_terms(post, cache):
+    """Term counts of a post body, cached by the hash of its source."""
+    key = cache_key('related-terms', post.hash)
+    cached = cache.get('related', key)
+    if cached is not None:
+        return json.loads(cached)
+    counts = Counter(tokenize(MARKUP_RE.sub(' ', post.load_markdown())))
+    cache.put('related', key, json.dumps(counts, sort_keys=True))
+    return dict(counts)
+
+
+def tfidf_vectors(term_counts):
+    """Unit-length sparse TF-IDF vectors ({term: weight}) for a list of term counts."""
+    n = len(term_counts)
+    df = Counter(term for counts in term_counts for term in counts)
+    max_df = max(2, MAX_DF * n)
+    idf = {term: math.log(n / d) for term, d in df.items() if d <= max_df}
+    vectors = []
+    for counts in term_counts:
+        vec = {t: (1 + math.log(c)) * idf[t] for t, c in counts.items() if t in idf}
+        norm = math.sqrt(sum(w * w for w in vec.values())) or 1.0
+        vectors.append({t: w / norm for t, w in vec.items()})
+    return vectors
+
+
+def text_scores(vectors):
+    """Per post, {other post: cosine similarity} for posts sharing a query term."""
+    postings = defaultdict(list)
+    for i, vec in enumerate(vectors):
+        for term, weight in vec.items():
+            postings[term].append((i, weight))
+    scores = []
+    for i, vec in enumerate(vectors):
+        acc = defaultdict(float)
+        # Terms unique to this post still count towards its norm, but can't match anything
+        shared = ((weight, term) for term, weight in vec.items() if len(postings[term]) > 1)
+        for weight, term in heapq.nlargest(QUERY_TERMS, shared):
+            for j, other in postings[term]:
+                acc[j] += weight * other
+        acc.pop(i, None)
+        scores.append(acc)
+    return scores
+
+
+def tag_cooccurrence(posts):
+    """Posts per tag and posts per (tag, tag) pair, tags in sorted order."""
+    counts = Counter()
+    pairs = Counter()
+    for post in posts:
+        tags = sorted({str(t) for t in post.tags})
+        counts.update(tags)
+        pairs.update(combinations(tags, 2))
+    return counts, pairs
+
+
+def tag_scores(posts, counts, pairs):
+    """Per post, {other post: score in [0, 1]} from shared and co-occurring tags.
+
+    A shared tag adds its IDF, so rare tags count more; a tag that often
+    appears alongside one of the post's tags (Jaccard over posts) adds a
+    damped share of its own IDF. Scores are divided by the post's own
+    total, so a post identical in tags scores 1. Candidates are the newest
+    TAG_CANDIDATES posts of each of those tags, scored exactly.
+    """
+    n = len(posts)
+    tag_sets = [{str(t) for t in post.tags} for post in posts]
+    by_tag = defaultdict(list)
+    for i, tags in enumerate(tag_sets):
+        for tag in tags:
+            by_tag[tag].append(i)
+    idf = {tag: math.log(1 + n / count) for tag, count in counts.items()}
+
+    associated = defaultdict(list)
+    for (a, b), both in pairs.items():
+        jaccard = both / (counts[a] + counts[b] - both)
+        associated[a].append((jaccard, b))
+        associated[b].append((jaccard, a))
+    for tag in associated:
+        associated[tag] = heapq.nlargest(RELATED_TAGS, associated[tag])
+
+    scores = []
+    for i, tags in enumerate(tag_sets):
+        weights = {tag: idf[tag] for tag in tags}
+        for tag in tags:
+            for jaccard, other in associated[tag]:
+                if other not in tags:
+                    weights[other] = weights.get(other, 0.0) + COOCCURRENCE_WEIGHT * jaccard * idf[other]
+        own = sum(idf[tag] for tag in tags) or 1.0
+        candidates = {j for tag in weights for j in by_tag[tag][-TAG_CANDIDATES:]}
+        candidates.discard(i)
+        result = {}
+        for j in candidates:
+            score = sum(weights.get(tag, 0.0) for tag in tag_sets[j])
+            result[j] = min(1.0, score / own)
+        scores.append(result)
+    return scores
+
+
+def compute_related(posts, cache, count=RELATED_COUNT):
+    """Return ({slug: [(slug, score), ...]}, (tag counts, tag pairs)) for `posts`."""
+    counts, pairs = tag_cooccurrence(posts)
+    by_text = text_scores(tfidf_vectors([body_terms(p, cache) for p in posts]))
+    by_tags = tag_scores(posts, counts, pairs)
+    related = {}
+    for i, post in enumerate(posts):
+        combined = defaultdict(float)
+        for j, s in by_text[i].items():
+            combined[j] += TEXT_WEIGHT * s
+        for j, s in by_tags[i].items():
+            combined[j] += TAG_WEIGHT * s
+        # Ties go to the newer post, so the order is stable
+        best = heapq.nlargest(count, ((round(s, 4), j) for j, s in combined.items() if s >= MIN_SCORE))
+        related[post.slug] = [(posts[j].slug, s) for s, j in best]
+    return related, (counts, pairs)
+
+
+def related_graph(posts, related, cooccurrence):
+    """Compact JSON-able graph: post nodes, weighted related edges and tag co-occurrence."""
+    index = {post.slug: i for i, post in enumerate(posts)}
+    counts, pairs = cooccurrence
+    return {
+        'posts': [[p.slug, p.title, p.date_str] for p in posts],
+        'related': [[index[slug], index[other], score]
+                    for slug, items in related.items() for other, score in items],
+        'tags': dict(sorted(counts.items())),
+        'cooccurrence': [[a, b, n] for (a, b), n in sorted(pairs.items())],
+    }
+
+
+def write_related_graph(posts, related, cooccurrence, path=RELATED_FILE):
+    graph = related_graph(posts, related, cooccurrence)
+    return write_if_changed(path, json.dumps(graph, separators=(',', ':'), ensure_ascii=False))
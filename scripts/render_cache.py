@@ -0,0 +1,188 @@
+import os
+import time
+import sqlite3
+import hashlib
+
+import markdown
+from markdown.extensions import Extension
+from markdown.extensions.codehilite import CodeHilite, CodeHiliteExtension, parse_hl_lines
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+
+from math_render import MathExtension, math_renderer
+
+try:
+    import pygments
+    PYGMENTS_VERSION = pygments.__version__
+except ImportError:
+    PYGMENTS_VERSION = None
+
+CACHE_FILE = '.build/cache/render.sqlite'
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+MARKDOWN_EXTENSIONS = ['fenced_code', 'codehilite']
+
+# Bump when the cached HTML would change for the same inputs (e.g. the
+# fenced-code handling below), so old entries stop matching.
+CACHE_VERSION = 1
+
+
+def cache_key(*parts):
+    h = hashlib.sha256()
+    for part in (CACHE_VERSION, markdown.__version__, PYGMENTS_VERSION) + parts:
+        h.update(repr(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class RenderCache:
+    """Size-bounded LRU store of rendered HTML, shared by the site generators.
+
+    Entries live in one SQLite file under .build/ so that several processes
+    (the render pool, generate_rss.py) can read and fill it concurrently.
+    Values are grouped by namespace, e.g. 'markdown' for whole post bodies,
+    'codeblock' for individual highlighted snippets and 'math' for
+    prerendered expressions.
+    """
+
+    def __init__(self, path=CACHE_FILE, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS entries (
+            ns TEXT, key TEXT, value TEXT, size INTEGER, last_used REAL,
+            PRIMARY KEY (ns, key))''')
+        self.hits = self.misses = 0
+
+    def get(self, ns, key):
+        row = self.db.execute('SELECT value FROM entries WHERE ns = ? AND key = ?', (ns, key)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute('UPDATE entries SET last_used = ? WHERE ns = ? AND key = ?', (time.time(), ns, key))
+        return row[0]
+
+    def put(self, ns, key, value):
+        self.db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                        (ns, key, value, len(value.encode('utf-8')), time.time()))
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        total = 0
+        stale = []
+        for ns, key, size in self.db.execute('SELECT ns, key, size FROM entries ORDER BY last_used DESC'):
+            total += size
+            if total > self.max_bytes:
+                stale.append((ns, key))
+        if stale:
+            self.db.executemany('DELETE FROM entries WHERE ns = ? AND key = ?', stale)
+        return len(stale)
+
+    def close(self):
+        self.db.close()
+
+
+class NullCache:
+    """Stand-in used with --no-cache: never hits, never stores."""
+
+    hits = misses = 0
+
+    def get(self, ns, key):
+        self.misses += 1
+        return None
+
+    def put(self, ns, key, value):
+        pass
+
+    def evict(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+def open_cache(enabled=True, path=CACHE_FILE, max_bytes=DEFAULT_MAX_BYTES):
+    return RenderCache(path, max_bytes) if enabled else NullCache()
+
+
+# --- Per-block highlighting cache ---
+
+class CachedFencedBlockPreprocessor(FencedBlockPreprocessor):
+    """Highlight plain ```lang fences through the cache before fenced_code sees them.
+
+    Fences using the {attr} syntax are left in place for the stock
+    fenced_code preprocessor, which runs right after this one.
+    """
+
+    def __init__(self, md, config, cache):
+        super().__init__(md, config)
+        self.cache = cache
+
+    def run(self, lines):
+        if not self.checked_for_deps:
+            for ext in self.md.registeredExtensions:
+                if isinstance(ext, CodeHiliteExtension):
+                    self.codehilite_conf = ext.getConfigs()
+            self.checked_for_deps = True
+        if not self.codehilite_conf or not self.codehilite_conf['use_pygments']:
+            return lines
+
+        text = "\n".join(lines)
+        index = 0
+        while True:
+            m = self.FENCED_BLOCK_RE.search(text, index)
+            if not m:
+                break
+            if m.group('attrs'):
+                index = m.end()
+                continue
+            local_config = self.codehilite_conf.copy()
+            if m.group('hl_lines'):
+                local_config['hl_lines'] = parse_hl_lines(m.group('hl_lines'))
+            lang = m.group('lang') or None
+            key = cache_key(m.group('code'), lang, sorted(local_config.items()))
+            code = self.cache.get('codeblock', key)
+            if code is None:
+                highliter = CodeHilite(
+                    m.group('code'),
+                    lang=lang,
+                    style=local_config.pop('pygments_style', 'default'),
+                    **local_config
+                )
+                code = highliter.hilite(shebang=False)
+                self.cache.put('codeblock', key, code)
+            placeholder = self.md.htmlStash.store(code)
+            text = f'{text[:m.start()]}\n{placeholder}\n{text[m.end():]}'
+            index = m.start() + 1 + len(placeholder)
+        return text.split("\n")
+
+
+class CachedFencedCodeExtension(Extension):
+    def __init__(self, cache, **kwargs):
+        self.cache = cache
+        super().__init__(**kwargs)
+
+    def extendMarkdown(self, md):
+        md.registerExtension(self)
+        md.preprocessors.register(CachedFencedBlockPreprocessor(md, {}, self.cache), 'cached_fenced_code', 26)
+
+
+def render_markdown(body, cache, extensions=MARKDOWN_EXTENSIONS, math=False):
+    """markdown.markdown() with whole-body and per-code-block caching.
+
+    With `math`, $…$ and $$…$$ spans are prerendered (see math_render.py).
+    """
+    renderer = math_renderer() if math else None
+    key = cache_key(body, extensions, renderer and renderer.name)
+    html = cache.get('markdown', key)
+    if html is None:
+        exts = list(extensions)
+        if 'fenced_code' in exts and 'codehilite' in exts:
+            exts.insert(0, CachedFencedCodeExtension(cache))
+        if renderer:
+            exts.append(MathExtension(cache, renderer))
+        html = markdown.markdown(body, extensions=exts)
+        cache.put('markdown', key, html)
+    return html
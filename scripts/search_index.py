@@ -0,0 +1,114 @@
+"""Build-time inverted index for the weblog search box.
+
+The index page no longer inlines every post; instead it fetches
+weblog/search/index.json on the first search, then only the docs list and
+the term shards its query needs. Shards are keyed by the first character
+of a term, so prefix (search-as-you-type) lookups touch a single file.
+
+Doc ids follow publication order (oldest first), so a new post appends a
+doc and only rewrites the shards of the terms it contains. Shard files are
+named by content hash: unchanged shards keep their names and stay cached.
+
+Terms are at least two characters long, except in tags: a tag such as "C"
+is indexed (and matched by the client) as a one-character term.
+"""
+import os
+import re
+import json
+import glob
+from collections import Counter
+
+from build_manifest import hash_text
+from output import stats as output_stats, write_if_changed
+from render_cache import cache_key
+
+SEARCH_DIR = 'weblog/search'
+INDEX_NAME = 'index.json'
+
+TOKEN_RE = re.compile(r'[^\W_]+')
+MARKUP_RE = re.compile(r'<[^>]+>|\]\([^)]*\)')
+
+# Field weights: a title hit ranks above a tag hit, which ranks above body text
+TITLE_WEIGHT = 10
+TAG_WEIGHT = 5
+MAX_BODY_WEIGHT = 5
+
+MIN_TERM_LENGTH = 2
+MIN_TAG_TERM_LENGTH = 1
+# Part of the cache key of post_terms(): bump when the terms it derives change
+TERMS_VERSION = 2
+
+
+def tokenize(text, min_length=MIN_TERM_LENGTH):
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) >= min_length]
+
+
+def shard_key(term):
+    c = term[0]
+    if 'a' <= c <= 'z':
+        return c
+    if '0' <= c <= '9':
+        return '0'
+    return '_'
+
+
+def post_terms(post, cache):
+    """Weighted terms of one post, cached by the hash of its source."""
+    key = cache_key('search-terms', TERMS_VERSION, post.hash)
+    cached = cache.get('search', key)
+    if cached is not None:
+        return json.loads(cached)
+    body_counts = Counter(tokenize(MARKUP_RE.sub(' ', post.load_markdown())))
+    weights = Counter({term: min(count, MAX_BODY_WEIGHT) for term, count in body_counts.items()})
+    for term in set(tokenize(post.title) + tokenize(post.weblog_title)):
+        weights[term] += TITLE_WEIGHT
+    for term in {t for tag in post.tags for t in tokenize(str(tag), MIN_TAG_TERM_LENGTH)}:
+        weights[term] += TAG_WEIGHT
+    cache.put('search', key, json.dumps(weights, sort_keys=True))
+    return dict(weights)
+
+
+def _dump(obj):
+    return json.dumps(obj, separators=(',', ':'), sort_keys=True, ensure_ascii=False)
+
+
+def _write_hashed(out_dir, stem, content):
+    """Write `content` as <stem>.<hash>.json unless that file already exists."""
+    name = f"{stem}.{hash_text(content)[:10]}.json"
+    path = os.path.join(out_dir, name)
+    # Same name, same content: no need to read it back
+    if os.path.exists(path):
+        output_stats.skipped += 1
+        return name, False
+    return name, write_if_changed(path, content)
+
+
+def build_search_index(posts, cache, out_dir=SEARCH_DIR):
+    """Write the docs list, term shards and index.json; return the number of files written.
+
+    `posts` must be in publication order (oldest first).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    docs = []
+    shards = {}
+    for doc_id, post in enumerate(posts):
+        docs.append([f"posts/{post.slug}/", post.title, post.date_str, [str(t) for t in post.tags]])
+        for term, weight in post_terms(post, cache).items():
+            shards.setdefault(shard_key(term), {}).setdefault(term, []).extend((doc_id, weight))
+
+    written = 0
+    meta = {'v': 1, 'shards': {}}
+    meta['docs'], changed = _write_hashed(out_dir, 'docs', _dump(docs))
+    written += changed
+    for key, terms in sorted(shards.items()):
+        meta['shards'][key], changed = _write_hashed(out_dir, f"terms-{key}", _dump(terms))
+        written += changed
+
+    written += write_if_changed(os.path.join(out_dir, INDEX_NAME), _dump(meta))
+
+    # Shards and docs lists from earlier builds are no longer referenced
+    live = {INDEX_NAME, meta['docs'], *meta['shards'].values()}
+    for path in glob.glob(os.path.join(out_dir, '*.json')):
+        if os.path.basename(path) not in live:
+            os.remove(path)
+    return written
@@ -0,0 +1,208 @@
+"""Local preview server that rebuilds on save and reloads open pages.
+
+    python scripts/serve.py [--port 8000] [--interval 0.05]
+
+Serves the site from the repository root. weblog/posts/*.md, blog/*.html,
+code/index.html and the stylesheets/scripts are polled for changes (stat
+only, so a check costs microseconds per file). A changed post triggers an
+incremental build in this process, where the manifest, the asset URLs and
+the render cache stay warm, so only the affected post, tag, archive and
+index outputs are redone. Blog and code pages only feed the feeds and
+the sitemap, which no preview shows: they are rewritten after the reload
+has been sent.
+
+Every HTML response gets a small script that listens on /__reload
+(server-sent events) and reloads the page after a rebuild.
+"""
+import os
+import glob
+import time
+import argparse
+import threading
+import traceback
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import generate_rss
+import generate_til
+from assets import AssetPipeline
+from content import load_posts
+from render_cache import CACHE_FILE
+
+# What to poll, and what a change in it requires
+WATCH = {
+    'posts': ['weblog/posts/*.md'],
+    'feed': ['blog/*.html', 'code/index.html'],
+    'static': ['weblog/weblog-style.css', 'blog/*.css', 'assets/*.js', 'assets/*.css'],
+}
+
+RELOAD_PATH = '/__reload'
+RELOAD_SCRIPT = b'<script>new EventSource("/__reload").onmessage = () => location.reload();</script>\n'
+KEEPALIVE_SECONDS = 15
+
+
+def snapshot(patterns):
+    """path -> (mtime_ns, size) of every file matching `patterns`."""
+    state = {}
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            state[path] = (st.st_mtime_ns, st.st_size)
+    return state
+
+
+class Reloader:
+    """Build counter that event-stream handlers block on."""
+
+    def __init__(self):
+        self.version = 0
+        self.changed = threading.Condition()
+
+    def notify(self):
+        with self.changed:
+            self.version += 1
+            self.changed.notify_all()
+
+    def wait(self, version, timeout):
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+
+class PreviewHandler(SimpleHTTPRequestHandler):
+    reloader = None
+
+    def do_GET(self):
+        url_path = self.path.split('?', 1)[0]
+        if url_path == RELOAD_PATH:
+            return self.send_events()
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and url_path.endswith('/'):
+            path = os.path.join(path, 'index.html')
+        if path.endswith('.html') and os.path.isfile(path):
+            return self.send_html(path)
+        return super().do_GET()
+
+    def end_headers(self):
+        # Always revalidate, so a reload shows the rebuilt page
+        self.send_header('Cache-Control', 'no-store')
+        super().end_headers()
+
+    def send_html(self, path):
+        with open(path, 'rb') as f:
+            body = f.read()
+        pos = body.rfind(b'</body>')
+        body = body + RELOAD_SCRIPT if pos == -1 else body[:pos] + RELOAD_SCRIPT + body[pos:]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        version = self.reloader.version
+        try:
+            while True:
+                latest = self.reloader.wait(version, KEEPALIVE_SECONDS)
+                self.wfile.write(b'data: reload\n\n' if latest != version else b': keepalive\n\n')
+                self.wfile.flush()
+                version = latest
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        # Only report failed requests
+        if len(args) > 1 and str(args[1]).startswith(('4', '5')):
+            super().log_message(format, *args)
+
+
+class SiteBuilder:
+    """Incremental builds that keep the manifest and published assets between runs."""
+
+    def __init__(self, page_size, use_cache=True, cache_path=CACHE_FILE):
+        self.page_size = page_size
+        self.use_cache = use_cache
+        self.cache_path = cache_path
+        self.manifest = generate_til.open_manifest()
+        self.assets = AssetPipeline()
+
+    def rebuild(self, pages=True):
+        """Bring the pages up to date; return the posts, for write_feeds()."""
+        posts = load_posts(self.manifest, incremental=True)
+        if pages:
+            # Remote images are only fetched by full builds: a failed fetch
+            # would be retried (and time out) on every save
+            generate_til.build(posts, self.manifest, incremental=True, page_size=self.page_size,
+                               assets=self.assets, fetch_images=False, use_cache=self.use_cache,
+                               cache_path=self.cache_path)
+        self.manifest.save()
+        return posts
+
+    def write_feeds(self, posts):
+        generate_rss.build(posts, self.page_size, use_cache=self.use_cache, cache_path=self.cache_path)
+
+
+def watch(builder, reloader, interval):
+    states = {kind: snapshot(patterns) for kind, patterns in WATCH.items()}
+    while True:
+        time.sleep(interval)
+        changed = set()
+        for kind, patterns in WATCH.items():
+            current = snapshot(patterns)
+            if current != states[kind]:
+                states[kind] = current
+                changed.add(kind)
+        if not changed:
+            continue
+        start = time.perf_counter()
+        try:
+            if 'static' in changed:
+                # Fingerprinted copies of our own scripts must be republished
+                builder.assets = AssetPipeline(fetch=False)
+            posts = builder.rebuild(pages=bool(changed & {'posts', 'static'}))
+        except Exception:
+            traceback.print_exc()
+            continue
+        print(f"Rebuilt ({', '.join(sorted(changed))}) in {(time.perf_counter() - start) * 1000:.0f} ms")
+        reloader.notify()
+        # No preview shows the feeds or the sitemap: they are written after the reload
+        try:
+            builder.write_feeds(posts)
+        except Exception:
+            traceback.print_exc()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the site locally, rebuilding and reloading on changes")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--bind', default='127.0.0.1')
+    parser.add_argument('--interval', type=float, default=0.05, help="seconds between change checks")
+    parser.add_argument('--page-size', type=int, default=generate_til.PAGE_SIZE)
+    parser.add_argument('--no-cache', action='store_true', help="don't read or fill the render cache")
+    parser.add_argument('--cache', default=CACHE_FILE, help=f"render cache location (default: {CACHE_FILE})")
+    args = parser.parse_args(argv)
+
+    builder = SiteBuilder(max(1, args.page_size), not args.no_cache, args.cache)
+    builder.write_feeds(builder.rebuild())
+
+    reloader = Reloader()
+    handler = type('Handler', (PreviewHandler,), {'reloader': reloader})
+    server = ThreadingHTTPServer((args.bind, args.port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving on http://{args.bind}:{args.port}/weblog/ (Ctrl+C to stop)")
+    try:
+        watch(builder, reloader, args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Page templates compiled to Python render functions.
+
+Templates live in scripts/templates/. The syntax is deliberately small:
+
+  {{ name }}               insert a value from the context, unescaped
+  {% include "file" %}     insert another template (a partial) at compile time
+
+Each template is compiled once per run: includes are inlined, then the
+literal text and the placeholders become the body of a generated
+function that writes them in order through `write`, so rendering a page
+is a fixed sequence of writes with no parsing or string building. A
+value is either a string or an iterable of strings, which is written
+piece by piece (e.g. a generator of list items).
+
+Hand-maintained pages the build updates in place (weblog/index.html)
+mark the generated parts with explicit regions:
+
+  <!-- region:name -->...<!-- /region:name -->
+
+parse_regions() compiles such a page into a template whose placeholders
+are the region contents, so a region is replaced without searching the
+page for the markup around it.
+"""
+import os
+import re
+
+from output import stream_if_changed
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+TOKEN_RE = re.compile(r'\{\{\s*(\w+)\s*\}\}|\{%\s*include\s+"([^"]+)"\s*%\}')
+REGION_RE = re.compile(r'(<!-- region:(\w+) -->)(.*?)(<!-- /region:\2 -->)', re.DOTALL)
+
+
+class Template:
+    """A compiled template; call render(write, context)."""
+
+    def __init__(self, name, parts):
+        # parts: literal strings and ('var', name) placeholders, in order
+        self.name = name
+        self.parts = parts
+        self.variables = [part[1] for part in parts if isinstance(part, tuple)]
+        self.render = _compile(name, parts)
+
+    def render_to(self, path, context, slug=None):
+        """Stream the page into `path` (only replaced if it changed); return True if written."""
+        with stream_if_changed(path, slug) as out:
+            self.render(out.write, context)
+        return out.written
+
+    def render_string(self, context):
+        parts = []
+        self.render(parts.append, context)
+        return ''.join(parts)
+
+
+def _compile(name, parts):
+    lines = ['def render(write, context):']
+    constants = {}
+    for i, part in enumerate(parts):
+        if isinstance(part, tuple):
+            lines.append(f'    value = context[{part[1]!r}]')
+            lines.append('    if value.__class__ is str:')
+            lines.append('        write(value)')
+            lines.append('    else:')
+            lines.append('        for piece in value:')
+            lines.append('            write(piece)')
+        elif part:
+            constants[f'_text{i}'] = part
+            lines.append(f'    write(_text{i})')
+    if len(lines) == 1:
+        lines.append('    pass')
+    namespace = dict(constants)
+    exec(compile('\n'.join(lines), f'<template {name}>', 'exec'), namespace)
+    return namespace['render']
+
+
+def _parse(source, name, seen=()):
+    """Literal text and ('var', name) tuples, with includes expanded."""
+    if name in seen:
+        raise ValueError(f"template {name} includes itself")
+    parts = []
+    pos = 0
+    for match in TOKEN_RE.finditer(source):
+        parts.append(source[pos:match.start()])
+        if match.group(1):
+            parts.append(('var', match.group(1)))
+        else:
+            parts.extend(_parse(_read(match.group(2)), match.group(2), seen + (name,)))
+        pos = match.end()
+    parts.append(source[pos:])
+    # Merge neighbouring literals so each costs a single write
+    merged = []
+    for part in parts:
+        if merged and isinstance(part, str) and isinstance(merged[-1], str):
+            merged[-1] += part
+        else:
+            merged.append(part)
+    return merged
+
+
+def _read(name):
+    with open(os.path.join(TEMPLATES_DIR, name), encoding='utf-8') as f:
+        source = f.read()
+    # Files end with a newline; the pages they replace didn't
+    return source[:-1] if source.endswith('\n') else source
+
+
+_compiled = {}
+
+
+def get(name):
+    """The compiled template `name` (a file in TEMPLATES_DIR), compiled on first use."""
+    if name not in _compiled:
+        _compiled[name] = Template(name, _parse(_read(name), name))
+    return _compiled[name]
+
+
+def parse_regions(text, name='page'):
+    """Compile a page with region markers; return (Template, {region: current content})."""
+    parts = []
+    current = {}
+    pos = 0
+    for match in REGION_RE.finditer(text):
+        region = match.group(2)
+        parts += [text[pos:match.start()] + match.group(1), ('var', region)]
+        current[region] = match.group(3)
+        pos = match.start(4)
+    parts.append(text[pos:])
+    return Template(name, parts), current